@@ -0,0 +1,134 @@
+"""Run scenebatch over folders of fake scenes in worker processes.
+
+Each worker installs the fake Maya instead of starting Maya, so the runs
+measure the batch tool's own process and queue overhead. Installing it
+takes longer than the per-scene timeout, as starting Maya can, which must
+not count against a worker's first scene. Every run also carries one
+scene with a bad name and one that hangs, which must come back as the
+only two failures. Workers that fail or hang while starting must fail
+their scenes and still return a report.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import fakemaya
+
+import benchmark
+
+SIZES = (10, 100, 1000)
+
+BAD_SCENE = "unversioned.ma"
+SLOW_SCENE = "slow_model_v001.ma"
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("batch")
+    group.add_argument("--batch-workers", type=int,
+                       help="Worker processes, the CPU count by default")
+    group.add_argument("--batch-timeout", type=float, default=2.0,
+                       help="Seconds allowed per scene")
+
+
+def start_maya(root, seconds):
+    """Install the fake Maya after a delay standing in for Maya's startup."""
+    time.sleep(seconds)
+    fakemaya.install(root)
+
+
+def broken_maya():
+    """Fail while starting, as a worker without a Maya license would."""
+    raise RuntimeError("No Maya license")
+
+
+def hung_maya():
+    """Never finish starting."""
+    time.sleep(3600)
+
+
+def fixup(path):
+    """Touch the opened scene, and hang on the slow one."""
+    import maya.cmds as cmds
+    if os.path.basename(path) == SLOW_SCENE:
+        time.sleep(3600)
+    cmds.group(empty=True, name="batch_fixup")
+
+
+def fill_folder(folder, count):
+    """Write `count` scenes to save-increment, plus the two bad ones."""
+    for index in range(count):
+        name = "shot{}_model_v001.ma".format(index)
+        with open(os.path.join(folder, name), "w") as scene_file:
+            scene_file.write("//Maya ASCII scene\n")
+    for name in (BAD_SCENE, SLOW_SCENE):
+        with open(os.path.join(folder, name), "w") as scene_file:
+            scene_file.write("//Maya ASCII scene\n")
+
+
+def check_startup(name, initializer, reason, size=0):
+    """Check a worker that cannot start fails its scenes, not the batch.
+
+    Every scene must fail with `reason`, including those given to the
+    workers replacing the first one.
+    """
+    import scenebatch
+    folder = tempfile.mkdtemp(prefix="scenebatch_bench_")
+    try:
+        fill_folder(folder, size)
+        scenes = scenebatch.expand_scenes([os.path.join(folder, "*.ma")])
+        report, seconds, _ = benchmark.measure(
+            lambda: scenebatch.run_batch(
+                scenes, workers=1, timeout=1.0, initializer=initializer,
+                startup_timeout=2.0),
+            False)
+        failed = sum(reason in (result.error or "")
+                     for result in report.results)
+        passed = failed == len(scenes) == len(report.results)
+        return benchmark.make_result(
+            "batch", name, len(scenes), seconds, failed=failed, passed=passed,
+            error="{} failed with {!r} of {}".format(failed, reason,
+                                                     len(scenes)))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run(args):
+    import scenebatch
+    results = []
+    for size in args.sizes or SIZES:
+        root = tempfile.mkdtemp(prefix="scenebatch_bench_")
+        try:
+            folder = os.path.join(root, "scenes")
+            os.makedirs(folder)
+            fill_folder(folder, size)
+            scenes = scenebatch.expand_scenes(
+                [os.path.join(folder, "*.ma")])
+            report, seconds, _ = benchmark.measure(
+                lambda: scenebatch.run_batch(
+                    scenes, "bench_batch:fixup", args.batch_workers,
+                    args.batch_timeout, "bench_batch:start_maya",
+                    (root, args.batch_timeout + 0.5)),
+                False)
+            failed = sorted(os.path.basename(result.path)
+                            for result in report.failures)
+            saved = sum(os.path.isfile(result.saved)
+                        for result in report.results if result.ok)
+            passed = failed == sorted([BAD_SCENE, SLOW_SCENE]) and \
+                saved == size
+            summary = report.summary()
+            results.append(benchmark.make_result(
+                "batch", "save increment", size, seconds,
+                workers=summary["workers"],
+                scenes_per_minute=summary["scenes_per_minute"],
+                failed=failed, passed=passed,
+                error="failed {}, saved {} of {}".format(failed, saved,
+                                                         size)))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    results.append(check_startup("startup failed",
+                                 "bench_batch:broken_maya",
+                                 "No Maya license"))
+    results.append(check_startup("startup hung", "bench_batch:hung_maya",
+                                 "did not start"))
+    return results
@@ -0,0 +1,56 @@
+"""Check that the Maya-free cores import within their time budget.
+
+Each module is imported in a fresh interpreter without the fake Maya, so
+any GUI, Maya or pymel import at load time fails the check as well as
+going over the budget.
+"""
+import json
+import subprocess
+import sys
+
+import fakemaya
+
+import benchmark
+
+BUDGETS = {"scenefile": 0.05}
+FORBIDDEN = ("maya", "PySide2", "shiboken2", "pymel")
+
+_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": sorted(
+    name for name in sys.modules if name.split(".")[0] in {forbidden!r})}}))
+"""
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("imports")
+    group.add_argument("--import-runs", type=int, default=5,
+                       help="Fresh interpreters per module, the fastest "
+                       "import is checked against the budget")
+
+
+def time_import(module, runs=5):
+    """Return the fastest import time of `module` and what it pulled in."""
+    timings = []
+    for _ in range(max(runs, 1)):
+        output = subprocess.check_output([
+            sys.executable, "-c",
+            _SCRIPT.format(src=fakemaya.SRC_DIR, module=module,
+                           forbidden=FORBIDDEN)])
+        timings.append(json.loads(output.decode("utf-8")))
+    return min(timings, key=lambda timing: timing["seconds"])
+
+
+def run(args):
+    results = []
+    for module, budget in sorted(BUDGETS.items()):
+        timing = time_import(module, args.import_runs)
+        passed = timing["seconds"] <= budget and not timing["loaded"]
+        results.append(benchmark.make_result(
+            "imports", module, 1, timing["seconds"], budget=budget,
+            loaded=timing["loaded"], passed=passed))
+    return results
@@ -0,0 +1,141 @@
+"""Time ScatterObject end to end on fake meshes of growing size.
+
+Each scatter must open a single undo chunk. Every size also checks that
+aligned instances aim along their normals, and an empty run must not
+touch the previous scatter.
+"""
+import os
+import tempfile
+
+import fakemaya
+
+import benchmark
+
+SIZES = (1000, 10000, 100000, 1000000)
+OUTPUTS = {"instances": 0, "instancer": 1}
+SAMPLING = {"vertices": 0, "surface": 1}
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("scatter")
+    group.add_argument("--output", choices=sorted(OUTPUTS),
+                       default="instances",
+                       help="Scatter output mode, instances by default")
+    group.add_argument("--sampling", choices=sorted(SAMPLING),
+                       default="vertices",
+                       help="Scatter point sampling, vertices by default")
+    group.add_argument("--align", action="store_true",
+                       help="Align instances to the surface normals")
+    group.add_argument("--workers", type=int, default=1,
+                       help="Processes used to build the transforms")
+
+
+def make_scatter(scene, size, output="instances", sampling="vertices",
+                 align=False, workers=1):
+    """Build a scene with a `size` vertex target and a ready ScatterObject.
+    """
+    import scatter
+    import scattermesh
+    target = scene.add_mesh("pPlane1", *fakemaya.grid_mesh(size))
+    source = scene.add_mesh("pCube1", *fakemaya.cube_mesh())
+    scatter_object = scatter.ScatterObject()
+    scatter_object.mesh_cache = scattermesh.MeshDataCache(
+        fakemaya.FakeMeshBackend(scene))
+    scatter_object.profile_memory = False
+    scene.selection = [source]
+    scatter_object.choose_source_object()
+    scene.selection = ["{}.vtx[0:{}]".format(target, size - 1)]
+    scatter_object.choose_dest_object()
+    scatter_object.scat_x_max = scatter_object.scat_y_max = \
+        scatter_object.scat_z_max = 360
+    scatter_object.scat_scale_xmin = scatter_object.scat_scale_ymin = \
+        scatter_object.scat_scale_zmin = 0.5
+    scatter_object.scat_scale_xmax = scatter_object.scat_scale_ymax = \
+        scatter_object.scat_scale_zmax = 1.5
+    scatter_object.scatter_percentage = 100
+    scatter_object.obj_pos_offset = 0.1
+    scatter_object.scatter_choice = 1 if align else 0
+    scatter_object.output_mode = OUTPUTS[output]
+    scatter_object.sampling_mode = SAMPLING[sampling]
+    scatter_object.workers = workers
+    scatter_object.seed = 1
+    return scatter_object
+
+
+def check_alignment(size):
+    """Check aligned instances aim along their normals at full rotations.
+
+    The X rotation must only spin an instance about its normal, so the
+    aim axis still follows the normal with the default 0-360 ranges.
+    """
+    import numpy
+    import scatterengine
+    normals = numpy.random.RandomState(size).normal(size=(size, 3))
+    normals /= numpy.linalg.norm(normals, axis=1, keepdims=True)
+    batch, seconds, _ = benchmark.measure(
+        lambda: scatterengine.generate_transforms(
+            numpy.zeros((size, 3)), (0, 0, 0), (360, 360, 360), (1, 1, 1),
+            (1, 1, 1), normals=normals, seed=1), False)
+    error = float(numpy.abs(batch.rotation_matrices()[:, 0]
+                            - normals).max())
+    return benchmark.make_result(
+        "scatter", "align aim", size, seconds, passed=error < 1e-6,
+        error="aim axis is up to {:.3g} off the normal".format(error))
+
+
+def check_empty_runs(size=1000):
+    """Check an empty instancer run or cache load leaves the last scatter's
+    recipe alone.
+
+    The recipe drives incremental updates, so writing an empty run's one
+    over a group that still holds its instances breaks the next update.
+    """
+    scene = fakemaya.install()
+    scatter_object = make_scatter(scene, size)
+    scatter_object.scat_align_check()
+    group = scatter_object.scatter_group
+    recipe = scatter_object.read_recipe(group)[0]
+    scatter_object.output_mode = OUTPUTS["instancer"]
+    scatter_object.scatter_percentage = 0
+    _, seconds, _ = benchmark.measure(scatter_object.scat_align_check, False)
+    kept = scatter_object.read_recipe(group)[0] == recipe
+    path = tempfile.mktemp(suffix=".scatter")
+    try:
+        scatter_object.export_cache(path)
+        scatter_object.output_mode = OUTPUTS["instances"]
+        scatter_object.scatter_percentage = 100
+        scatter_object.scat_align_check()
+        group = scatter_object.scatter_group
+        recipe = scatter_object.read_recipe(group)[0]
+        scatter_object.output_mode = OUTPUTS["instancer"]
+        for _ in scatter_object.iter_load_cache(path):
+            pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    kept = kept and scatter_object.read_recipe(group)[0] == recipe
+    return benchmark.make_result(
+        "scatter", "empty run", size, seconds, passed=kept,
+        error="an empty run rewrote the recipe of {}".format(group))
+
+
+def run(args):
+    results = []
+    for size in args.sizes or SIZES:
+        scene = fakemaya.install()
+        scatter_object = make_scatter(scene, size, args.output,
+                                      args.sampling, args.align, args.workers)
+        scene.calls.clear()
+        _, seconds, peak = benchmark.measure(scatter_object.scat_align_check,
+                                             not args.no_memory)
+        report = scatter_object.profiler.report()
+        results.append(benchmark.make_result(
+            "scatter", "{} {}".format(args.sampling, args.output),
+            scatter_object.scatter_count(), seconds, peak, scene.calls,
+            phases=report["phases"], undo_entries=report["undo_entries"],
+            passed=scene.calls["undoInfo"] == 2,
+            error="{} undoInfo calls, a scatter must undo in one step"
+            .format(scene.calls["undoInfo"])))
+        results.append(check_alignment(size))
+    results.append(check_empty_runs())
+    return results
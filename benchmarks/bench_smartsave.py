@@ -0,0 +1,197 @@
+"""Time SceneFile version lookups and saves on folders of many files.
+
+A stress run also has many processes save-increment the same scene at
+once, and fails if any two of them wrote the same version.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import fakemaya
+
+import benchmark
+
+SIZES = (10, 100, 1000, 10000, 100000)
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("smartsave")
+    group.add_argument("--repeat", type=int, default=5,
+                       help="Version lookups timed per folder, the best "
+                       "one is kept")
+    group.add_argument("--writers", type=int, default=32,
+                       help="Processes saving increments at once in the "
+                       "stress run")
+    group.add_argument("--increments", type=int, default=5,
+                       help="Increments saved by each stress writer")
+
+
+def fill_folder(folder, count, descriptor="main", task="model", ext=".ma"):
+    """Write `count` versions of a scene, plus some unrelated files."""
+    for ver in range(1, count + 1):
+        name = "{}_{}_v{:03d}{}".format(descriptor, task, ver, ext)
+        with open(os.path.join(folder, name), "w") as scene_file:
+            scene_file.write("//Maya ASCII scene\n")
+    for index in range(count // 10):
+        name = "other_{}_v{:03d}.mb".format(task, index + 1)
+        open(os.path.join(folder, name), "w").close()
+    # Age the folder so its version index can be trusted between lookups.
+    settled = time.time() - 60
+    os.utime(folder, (settled, settled))
+
+
+def run_catalog(root, size):
+    """Time a cold and an incremental catalog scan and a latest query.
+
+    Starting a background rescan is timed too, as that is all the UI waits
+    for, and the rescan must find the latest version once it finishes.
+    """
+    import scenecatalog
+    catalog = scenecatalog.SceneCatalog(root, ":memory:")
+    results = []
+    for name in ("catalog rescan cold", "catalog rescan"):
+        _, seconds, _ = benchmark.measure(catalog.rescan, False)
+        results.append(benchmark.make_result("smartsave", name, size,
+                                             seconds))
+    record, seconds, _ = benchmark.measure(
+        lambda: catalog.latest("main", "model"), False)
+    results.append(benchmark.make_result("smartsave", "catalog latest", size,
+                                         seconds, version=record.version))
+    catalog.close()
+    database = os.path.join(root, "catalog.sqlite")
+    catalog = scenecatalog.SceneCatalog(root, database)
+    job, seconds, _ = benchmark.measure(
+        lambda: catalog.rescan_in_background(), False)
+    job.finished.wait()
+    record = catalog.latest("main", "model")
+    results.append(benchmark.make_result(
+        "smartsave", "catalog rescan start", size, seconds,
+        passed=job.error is None and record is not None and
+        record.version == size,
+        error="background rescan found {}".format(
+            record.version if record else None)))
+    catalog.close()
+    return results
+
+
+def _stress_writer(root, ready, start, increments, results):
+    fakemaya.install(root)
+    import scenefile
+    import scenemanifest
+    scene_file = scenefile.SceneFile(
+        os.path.join(root, "scenes", "main_model_v001.ma"))
+    ready.put(True)
+    start.wait()
+    saved = []
+    try:
+        for _ in range(increments):
+            saved.append(scene_file.save_increment())
+        scenemanifest.wait()
+    finally:
+        results.put(saved)
+
+
+def run_stress(writers, increments):
+    """Save-increment one scene from many processes at once."""
+    context = multiprocessing.get_context("spawn")
+    root = tempfile.mkdtemp(prefix="smartsave_stress_")
+    try:
+        folder = os.path.join(root, "scenes")
+        os.makedirs(folder)
+        ready = context.Queue()
+        start = context.Event()
+        results = context.Queue()
+        processes = [context.Process(
+            target=_stress_writer,
+            args=(root, ready, start, increments, results))
+            for _ in range(writers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=120)
+        began = time.time()
+        start.set()
+        saved = []
+        for _ in processes:
+            saved.extend(results.get(timeout=120))
+        seconds = time.time() - began
+        for process in processes:
+            process.join()
+        expected = writers * increments
+        import scenemanifest
+        names = os.listdir(folder)
+        files = [name for name in names
+                 if not name.endswith(scenemanifest.MANIFEST_SUFFIX) and
+                 os.path.getsize(os.path.join(folder, name))]
+        manifests = len(names) - len(files)
+        passed = len(saved) == len(set(saved)) == len(files) == \
+            manifests == expected
+        return benchmark.make_result(
+            "smartsave", "stress save_increment", expected, seconds,
+            writers=writers, passed=passed,
+            error="{} saves, {} unique, {} files, {} manifests for {} "
+            "increments".format(len(saved), len(set(saved)), len(files),
+                                manifests, expected))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run(args):
+    results = []
+    for size in args.sizes or SIZES:
+        root = tempfile.mkdtemp(prefix="smartsave_bench_")
+        try:
+            folder = os.path.join(root, "scenes")
+            os.makedirs(folder)
+            fill_folder(folder, size)
+            scene = fakemaya.install(root)
+            import scenefile
+            results.extend(run_catalog(root, size))
+            import scenenaming
+            names = os.listdir(folder)
+            scenes, seconds, peak = benchmark.measure(
+                lambda: scenenaming.default_template().parse_many(names),
+                not args.no_memory)
+            results.append(benchmark.make_result(
+                "smartsave", "parse_many", len(names), seconds, peak,
+                scenes=len(scenes)))
+            scene_file = scenefile.SceneFile(
+                os.path.join(folder, "main_model_v001.ma"))
+            for name, cold in (("next_avail_ver cold", True),
+                               ("next_avail_ver", False)):
+                timings = []
+                for _ in range(max(args.repeat, 1)):
+                    if cold:
+                        scenefile.clear_version_indexes()
+                    scene.calls.clear()
+                    timings.append(benchmark.measure(
+                        scene_file.next_avail_ver, not args.no_memory))
+                ver, seconds, peak = min(timings,
+                                         key=lambda timing: timing[1])
+                results.append(benchmark.make_result(
+                    "smartsave", name, size, seconds, peak, scene.calls,
+                    version=ver))
+            scene.calls.clear()
+            _, seconds, peak = benchmark.measure(scene_file.save_increment,
+                                                 not args.no_memory)
+            results.append(benchmark.make_result(
+                "smartsave", "save_increment", size, seconds, peak,
+                scene.calls, version=scene_file.ver))
+            # An unchanged scene must not write another version.
+            scene.modified = True
+            scene_file.checkpoint_interval = 0
+            scene.calls.clear()
+            saved, seconds, peak = benchmark.measure(scene_file.checkpoint,
+                                                     not args.no_memory)
+            results.append(benchmark.make_result(
+                "smartsave", "checkpoint unchanged", size, seconds, peak,
+                scene.calls, version=scene_file.ver,
+                skip_reason=scene_file.skip_reason,
+                passed=saved is None and scene_file.skip_reason is not None,
+                error="saved {}".format(saved)))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    results.append(run_stress(args.writers, args.increments))
+    return results
@@ -0,0 +1,126 @@
+"""Run the scatter and smart save benchmarks on a plain Python install.
+
+Maya and PySide2 are replaced by the fakes in fakemaya, so the numbers
+show the tools' own overhead and command-call counts rather than Maya's.
+Results carrying a budget fail the run when they miss it. Run from the
+repository root:
+
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py scatter --sizes 1000 10000
+    python benchmarks/benchmark.py smartsave --json results.json
+    python benchmarks/benchmark.py imports
+    python benchmarks/benchmark.py batch --batch-workers 4
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+
+def _timer():
+    return time.perf_counter()
+
+
+def measure(function, track_memory=True):
+    """Call `function` and return its result, wall time and peak memory.
+
+    Returns:
+        tuple: The result, the seconds taken and the peak traced Python
+            memory in bytes, or None when memory is not tracked
+    """
+    if track_memory:
+        tracemalloc.start()
+    start = _timer()
+    try:
+        result = function()
+        seconds = _timer() - start
+        peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+    finally:
+        if track_memory:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def make_result(suite, name, size, seconds, peak=None, commands=None,
+                **extra):
+    """Build one benchmark record."""
+    result = {
+        "suite": suite,
+        "name": name,
+        "size": size,
+        "seconds": seconds,
+        "per_second": size / seconds if seconds else None,
+        "peak_memory_bytes": peak,
+        "commands": dict(commands or {}),
+    }
+    result.update(extra)
+    return result
+
+
+def format_results(results):
+    """Return the results as a plain text table."""
+    lines = ["{:<10} {:<24} {:>9} {:>10} {:>12} {:>10} {:>10}".format(
+        "suite", "benchmark", "size", "seconds", "items/s", "peak MB",
+        "commands")]
+    for result in results:
+        peak = result["peak_memory_bytes"]
+        lines.append(
+            "{:<10} {:<24} {:>9} {:>10.4f} {:>12} {:>10} {:>10}".format(
+                result["suite"], result["name"], result["size"],
+                result["seconds"],
+                "{:.0f}".format(result["per_second"])
+                if result["per_second"] else "-",
+                "{:.1f}".format(peak / 1048576.0) if peak is not None
+                else "-",
+                sum(result["commands"].values())))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import bench_batch
+    import bench_imports
+    import bench_scatter
+    import bench_smartsave
+    suites = {"batch": bench_batch, "imports": bench_imports,
+              "scatter": bench_scatter, "smartsave": bench_smartsave}
+    parser = argparse.ArgumentParser(
+        description="Benchmark the tools against a fake Maya.")
+    parser.add_argument("suites", nargs="*",
+                        help="Suites to run out of {}, all of them by "
+                        "default".format(", ".join(sorted(suites))))
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="Override the sizes every suite runs at")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip memory tracing, which slows the runs")
+    parser.add_argument("--json", help="Also write the results to a file")
+    for suite in suites.values():
+        suite.add_arguments(parser)
+    args = parser.parse_args(argv)
+    for name in args.suites:
+        if name not in suites:
+            parser.error("unknown suite: {}".format(name))
+    results = []
+    for name in args.suites or sorted(suites):
+        results.extend(suites[name].run(args))
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "results": results},
+                      results_file, indent=2, sort_keys=True)
+    failed = [result for result in results
+              if result.get("passed") is False]
+    for result in failed:
+        if "budget" in result:
+            print("FAILED {suite} {name}: {seconds:.4f}s against a budget "
+                  "of {budget}s, loaded {loaded}".format(**result))
+        else:
+            print("FAILED {suite} {name}: {error}".format(**result))
+    return results, failed
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(sys.argv[1:])[1] else 0)
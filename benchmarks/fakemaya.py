@@ -0,0 +1,477 @@
+"""A stand-in for the Maya and PySide2 modules the tools import.
+
+`install` puts fake modules into sys.modules so scatter.py, smartsave.py
+and scenefile.py import on a plain Python install. maya.cmds is backed by a
+FakeScene that keeps a simple DAG of nodes and attributes in memory, and
+saves write real files so folder scans see them. Meshes are held as
+numpy arrays and read through FakeMeshBackend.
+"""
+import collections
+import os
+import sys
+import types
+import uuid
+
+import numpy
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       os.pardir, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import scattermesh
+
+# Commands that leave the scene with unsaved changes.
+EDIT_COMMANDS = frozenset([
+    "addAttr", "delete", "group", "instance", "parent", "particle",
+    "particleInstancer", "saveInitialState", "setAttr", "xform"])
+
+
+class FakeNode(object):
+    """A DAG node, its children are kept in creation order by name."""
+
+    def __init__(self, name, node_type, parent=None):
+        self.name = name
+        self.type = node_type
+        self.parent = parent
+        self.children = {}
+        self.attrs = {}
+        self.connections = []
+
+
+class FakeScene(object):
+    """The nodes, selection and files behind the fake maya.cmds."""
+
+    def __init__(self, root_directory=None):
+        self.root_directory = root_directory or os.getcwd()
+        self.calls = collections.Counter()
+        self.clear()
+
+    def clear(self):
+        """Empty the scene and reset the call counts."""
+        self.nodes = {}
+        self.meshes = {}
+        self.selection = []
+        self.scene_name = ""
+        self.modified = False
+        self.name_counters = collections.Counter()
+        self.calls.clear()
+
+    def command(self, name):
+        """Return the counted maya.cmds function for a command."""
+        function = getattr(self, "cmd_" + name)
+        calls = self.calls
+
+        def command(*args, **kwargs):
+            calls[name] += 1
+            if name in EDIT_COMMANDS and not (kwargs.get("query") or
+                                              kwargs.get("q")):
+                self.modified = True
+            return function(*args, **kwargs)
+
+        command.__name__ = name
+        return command
+
+    def commands(self):
+        return [name[4:] for name in dir(self) if name.startswith("cmd_")]
+
+    # Scene building
+
+    def unique_name(self, name):
+        if "#" not in name and name not in self.nodes:
+            return name
+        base = name.replace("#", "")
+        while True:
+            self.name_counters[base] += 1
+            candidate = "{}{}".format(base, self.name_counters[base])
+            if candidate not in self.nodes:
+                return candidate
+
+    def create_node(self, name, node_type, parent=None):
+        node = FakeNode(self.unique_name(name), node_type)
+        self.nodes[node.name] = node
+        if parent is not None:
+            self.reparent(node, self.node(parent))
+        return node
+
+    def node(self, name):
+        if not isinstance(name, str):
+            name, = name
+        name = name.split(".")[0].rsplit("|", 1)[-1]
+        try:
+            return self.nodes[name]
+        except KeyError:
+            raise ValueError("No object matches name: {}".format(name))
+
+    def reparent(self, node, parent):
+        if node.parent is not None:
+            del node.parent.children[node.name]
+        node.parent = parent
+        if parent is not None:
+            parent.children[node.name] = node
+
+    def full_path(self, node):
+        names = []
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return "|" + "|".join(reversed(names))
+
+    def add_mesh(self, name, positions, normals, triangles):
+        """Create a mesh transform and shape from arrays."""
+        transform = self.create_node(name, "transform")
+        shape = self.create_node(name + "Shape", "mesh", transform.name)
+        positions = numpy.ascontiguousarray(positions, dtype=numpy.float64)
+        shape.attrs["boundingBoxMin"] = [tuple(positions.min(axis=0))]
+        shape.attrs["boundingBoxMax"] = [tuple(positions.max(axis=0))]
+        self.meshes[transform.name] = (positions, normals, triangles)
+        return transform.name
+
+    # maya.cmds
+
+    def cmd_about(self, version=False, **kwargs):
+        return "2020"
+
+    def cmd_workspace(self, *args, **kwargs):
+        return self.root_directory
+
+    def cmd_ls(self, *args, **kwargs):
+        if kwargs.get("selection") or kwargs.get("sl") or \
+                kwargs.get("os") or kwargs.get("orderedSelection"):
+            names = list(self.selection)
+        else:
+            names = list(args) or list(self.nodes)
+        if kwargs.get("o") or kwargs.get("objectsOnly"):
+            names = [name.split(".")[0] for name in names]
+        if kwargs.get("transforms"):
+            names = [name for name in names if name in self.nodes
+                     and self.nodes[name].type == "transform"]
+        return names
+
+    def cmd_select(self, *args, **kwargs):
+        if kwargs.get("clear"):
+            self.selection = []
+            return
+        items = []
+        for arg in args:
+            items.extend([arg] if isinstance(arg, str) else arg)
+        self.selection = items
+
+    def cmd_objExists(self, name):
+        try:
+            self.node(name)
+        except ValueError:
+            return False
+        return True
+
+    def cmd_polyListComponentConversion(self, components, toVertex=False,
+                                        **kwargs):
+        if isinstance(components, str):
+            components = [components]
+        vertices = []
+        for component in components:
+            mesh = component.split(".")[0]
+            if mesh not in self.meshes:
+                continue
+            if ".vtx[" in component:
+                vertices.append(component)
+            else:
+                count = len(self.meshes[mesh][0])
+                vertices.append("{}.vtx[0:{}]".format(mesh, count - 1))
+        return vertices
+
+    def cmd_group(self, *args, **kwargs):
+        return self.create_node(kwargs.get("name", "group#"),
+                                "transform").name
+
+    def cmd_instance(self, source, name=None, **kwargs):
+        source_node = self.node(source)
+        node = self.create_node(name or source + "#", "transform")
+        node.attrs["instanceOf"] = source_node.name
+        return [node.name]
+
+    def cmd_parent(self, *args, **kwargs):
+        names = []
+        for arg in args:
+            names.extend([arg] if isinstance(arg, str) else arg)
+        parent = self.node(names.pop())
+        for name in names:
+            self.reparent(self.node(name), parent)
+        return [self.node(name).name for name in names]
+
+    def cmd_xform(self, node, query=False, q=False, **kwargs):
+        node = self.node(node)
+        if query or q:
+            return node.attrs.get("matrix", [1.0, 0.0, 0.0, 0.0,
+                                             0.0, 1.0, 0.0, 0.0,
+                                             0.0, 0.0, 1.0, 0.0,
+                                             0.0, 0.0, 0.0, 1.0])
+        if "matrix" in kwargs:
+            node.attrs["matrix"] = list(kwargs["matrix"])
+
+    def cmd_listRelatives(self, name, children=False, shapes=False,
+                          allDescendents=False, parent=False, fullPath=False,
+                          type=None, **kwargs):
+        node = self.node(name)
+        if parent:
+            nodes = [node.parent] if node.parent else []
+        elif allDescendents:
+            nodes = []
+            pending = list(node.children.values())
+            while pending:
+                child = pending.pop()
+                nodes.append(child)
+                pending.extend(child.children.values())
+        else:
+            nodes = list(node.children.values())
+            if shapes:
+                nodes = [child for child in nodes if child.type != "transform"]
+        if type:
+            nodes = [child for child in nodes if child.type == type]
+        if not nodes:
+            return None
+        if fullPath:
+            return [self.full_path(child) for child in nodes]
+        return [child.name for child in nodes]
+
+    def cmd_delete(self, *args, **kwargs):
+        names = []
+        for arg in args:
+            names.extend([arg] if isinstance(arg, str) else arg)
+        for name in names:
+            if not self.cmd_objExists(name):
+                continue
+            node = self.node(name)
+            self.reparent(node, None)
+            pending = [node]
+            while pending:
+                current = pending.pop()
+                self.nodes.pop(current.name, None)
+                pending.extend(current.children.values())
+
+    def cmd_attributeQuery(self, attribute, node=None, exists=False,
+                           **kwargs):
+        return attribute in self.node(node).attrs
+
+    def cmd_addAttr(self, node, longName=None, dataType=None, **kwargs):
+        self.node(node).attrs.setdefault(longName, None)
+
+    def cmd_setAttr(self, plug, *values, **kwargs):
+        node, attribute = plug.split(".", 1)
+        if kwargs.get("type") == "vectorArray":
+            values = values[1:]
+        self.node(node).attrs[attribute] = values[0] if len(values) == 1 \
+            else list(values)
+
+    def cmd_getAttr(self, plug, **kwargs):
+        node, attribute = plug.split(".", 1)
+        return self.node(node).attrs.get(attribute)
+
+    def cmd_particle(self, position=None, name=None, **kwargs):
+        transform = self.create_node(name or "particle#", "transform")
+        shape = self.create_node(transform.name + "Shape", "particle",
+                                 transform.name)
+        shape.attrs["position"] = [tuple(point) for point in position or []]
+        return [transform.name, shape.name]
+
+    def cmd_saveInitialState(self, *args, **kwargs):
+        pass
+
+    def cmd_particleInstancer(self, shape, object=None, name=None, **kwargs):
+        instancer = self.create_node(name or "instancer#", "instancer")
+        instancer.connections.append(self.node(object).name)
+        self.node(shape).connections.append(instancer.name)
+        return instancer.name
+
+    def cmd_listConnections(self, plug, type=None, **kwargs):
+        names = self.node(plug).connections
+        if type:
+            names = [name for name in names if name in self.nodes
+                     and self.nodes[name].type == type]
+        return list(names) or None
+
+    def cmd_file(self, *args, **kwargs):
+        if kwargs.get("query") or kwargs.get("q"):
+            if kwargs.get("sceneName") or kwargs.get("sn"):
+                return self.scene_name
+            if kwargs.get("modified") or kwargs.get("amf"):
+                return self.modified
+            return None
+        if kwargs.get("open") or kwargs.get("o"):
+            path = str(args[0])
+            if not os.path.isfile(path):
+                raise RuntimeError("File not found: {}".format(path))
+            self.scene_name = path
+            self.modified = False
+            return path
+        if "rename" in kwargs:
+            self.scene_name = str(kwargs["rename"])
+            return self.scene_name
+        if kwargs.get("save"):
+            return self.save_scene(self.scene_name)
+        return None
+
+    def cmd_undoInfo(self, *args, **kwargs):
+        return True
+
+    def cmd_refresh(self, *args, **kwargs):
+        pass
+
+    def save_scene(self, path):
+        """Write a small placeholder file for the current scene."""
+        path = str(path)
+        if not os.path.isdir(os.path.dirname(path)):
+            raise RuntimeError("Could not save file {}".format(path))
+        with open(path, "w") as scene_file:
+            scene_file.write("//Maya ASCII scene\n")
+            scene_file.write("//Name: {}\n".format(os.path.basename(path)))
+            scene_file.write('requires maya "2022";\n')
+            scene_file.write("currentUnit -l centimeter -a degree "
+                             "-t film;\n")
+            scene_file.write('fileInfo "application" "maya";\n')
+            scene_file.write('fileInfo "UUID" "{}";\n'.format(uuid.uuid4()))
+            scene_file.write('fileInfo "license" "student";\n')
+            for name in sorted(self.nodes):
+                scene_file.write("createNode {} -n \"{}\";\n".format(
+                    self.nodes[name].type, name))
+        self.scene_name = path
+        self.modified = False
+        return path
+
+
+class FakeMeshBackend(scattermesh.MeshBackend):
+    """Reads the meshes added to a FakeScene."""
+
+    def __init__(self, scene):
+        self.scene = scene
+
+    def _mesh(self, mesh):
+        return self.scene.meshes[self.scene.node(mesh).name]
+
+    def vertex_positions(self, mesh):
+        return self._mesh(mesh)[0]
+
+    def vertex_normals(self, mesh):
+        return self._mesh(mesh)[1]
+
+    def triangles(self, mesh):
+        return self._mesh(mesh)[2]
+
+    def vertex_colors(self, mesh, color_set):
+        positions = self._mesh(mesh)[0]
+        colors = numpy.ones((len(positions), 4))
+        colors[:, :3] = numpy.abs(numpy.sin(positions))
+        return colors
+
+    def vertex_weights(self, mesh, attribute):
+        positions = self._mesh(mesh)[0]
+        return numpy.linspace(0.0, 1.0, len(positions))
+
+    def vertex_uvs(self, mesh, uv_set=None):
+        positions = self._mesh(mesh)[0]
+        span = numpy.ptp(positions[:, [0, 2]], axis=0)
+        return (positions[:, [0, 2]] - positions[:, [0, 2]].min(axis=0)) / \
+            numpy.where(span > 0.0, span, 1.0)
+
+    def sample_texture(self, texture, uvs):
+        return numpy.asarray(uvs)[:, 0]
+
+    def add_change_callback(self, mesh, callback, removed=None):
+        return None
+
+    def remove_change_callback(self, handle):
+        pass
+
+
+def grid_mesh(vertex_count, size=100.0):
+    """Return positions, normals and triangles of a bumpy square grid.
+
+    The grid has at least `vertex_count` vertices.
+    """
+    side = max(int(numpy.ceil(numpy.sqrt(vertex_count))), 2)
+    coords = numpy.linspace(-size / 2.0, size / 2.0, side)
+    x_pos, z_pos = numpy.meshgrid(coords, coords)
+    frequency = 8.0 * numpy.pi / size
+    y_pos = numpy.sin(x_pos * frequency) * numpy.cos(z_pos * frequency)
+    positions = numpy.stack([x_pos, y_pos, z_pos], axis=-1).reshape(-1, 3)
+    normals = numpy.stack(
+        [-frequency * numpy.cos(x_pos * frequency) *
+         numpy.cos(z_pos * frequency), numpy.ones_like(x_pos),
+         frequency * numpy.sin(x_pos * frequency) *
+         numpy.sin(z_pos * frequency)], axis=-1).reshape(-1, 3)
+    normals /= numpy.linalg.norm(normals, axis=1, keepdims=True)
+    ids = numpy.arange(side * side).reshape(side, side)
+    corners = (ids[:-1, :-1].ravel(), ids[:-1, 1:].ravel(),
+               ids[1:, :-1].ravel(), ids[1:, 1:].ravel())
+    triangles = numpy.concatenate([
+        numpy.stack([corners[0], corners[2], corners[1]], axis=1),
+        numpy.stack([corners[1], corners[2], corners[3]], axis=1)])
+    return positions, normals, triangles
+
+
+def cube_mesh(size=1.0):
+    """Return positions, normals and triangles of a cube around the origin.
+    """
+    half = size / 2.0
+    positions = numpy.array([(x, y, z) for x in (-half, half)
+                             for y in (-half, half) for z in (-half, half)])
+    normals = positions / numpy.linalg.norm(positions, axis=1, keepdims=True)
+    triangles = numpy.array([
+        (0, 1, 3), (0, 3, 2), (4, 6, 7), (4, 7, 5), (0, 4, 5), (0, 5, 1),
+        (2, 3, 7), (2, 7, 6), (0, 2, 6), (0, 6, 4), (1, 5, 7), (1, 7, 3)])
+    return positions, normals, triangles
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+class _QtStub(object):
+    """Accepts any Qt call, only the module-level names are needed."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return _QtStub()
+
+    def __call__(self, *args, **kwargs):
+        return _QtStub()
+
+
+def _slot(*types_):
+    return lambda function: function
+
+
+_SCENE = None
+
+
+def install(root_directory=None):
+    """Install the fake modules and return the FakeScene behind them.
+
+    Installing again returns the same scene, cleared and pointed at
+    `root_directory` when one is given.
+    """
+    global _SCENE
+    if _SCENE is not None:
+        _SCENE.clear()
+        if root_directory:
+            _SCENE.root_directory = root_directory
+        return _SCENE
+    scene = FakeScene(root_directory)
+    cmds = _module("maya.cmds", **dict(
+        (name, scene.command(name)) for name in scene.commands()))
+    open_maya_ui = _module("maya.OpenMayaUI",
+                           MQtUtil=_QtStub())
+    _module("maya", cmds=cmds, OpenMayaUI=open_maya_ui)
+    qt_widgets = _module("PySide2.QtWidgets", QDialog=_QtStub,
+                         QWidget=_QtStub, __getattr__=lambda name: _QtStub)
+    qt_core = _module("PySide2.QtCore", Slot=_slot, Qt=_QtStub(),
+                      __getattr__=lambda name: _QtStub)
+    _module("PySide2", QtWidgets=qt_widgets, QtCore=qt_core)
+    _module("shiboken2", wrapInstance=lambda *args: _QtStub())
+    _SCENE = scene
+    return scene
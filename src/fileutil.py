@@ -0,0 +1,83 @@
+"""File and background work helpers shared by the save and cache tools."""
+import logging
+import os
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 5.0
+
+
+def replace(source, destination):
+    """Rename `source` over `destination` atomically."""
+    os.replace(source, destination)
+
+
+class BackgroundWorker(object):
+    """Hands queued items to `handler` in order on one background thread.
+
+    The thread starts with the first item and stops once it has been idle
+    for `idle_timeout` seconds. It is a daemon thread, so an owner whose
+    work must land before Python exits has to `wait` for it.
+
+    Args:
+        name (str): The thread's name
+        handler (callable): Called on the thread with each item. It should
+            record its own failures, anything it raises is only logged.
+        idle_timeout (float): Seconds without work before the thread stops
+    """
+
+    def __init__(self, name, handler, idle_timeout=IDLE_TIMEOUT):
+        self.name = name
+        self.handler = handler
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = []
+        self._thread = None
+
+    def put(self, item):
+        """Queue an item, starting the thread if it is not running."""
+        with self._lock:
+            self._pending.append(item)
+            self._queue.put(item)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def pending(self):
+        """Return the items not yet handled, oldest first."""
+        with self._lock:
+            return list(self._pending)
+
+    def wait(self, timeout=None):
+        """Block until every queued item has been handled.
+
+        Returns:
+            bool: True if they were all handled within `timeout` seconds
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                self.handler(item)
+            except Exception:
+                log.exception("%s could not handle %r", self.name, item)
+            with self._lock:
+                self._pending.remove(item)
+                if not self._pending:
+                    self._idle.notify_all()
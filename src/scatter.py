@@ -1,18 +1,106 @@
+import contextlib
+import functools
+import hashlib
+import json
 import logging
-import random
+import sys
+import time
 
+import numpy
 from PySide2 import QtWidgets, QtCore
 from shiboken2 import wrapInstance
 import maya.OpenMayaUI as omui
 import maya.cmds as cmds
 
+import scattercache
+import scatterdensity
+import scatterengine
+import scattermesh
+import scatterprofile
+import scattersample
+
+__version__ = "1.1.0"
+
 log = logging.getLogger(__name__)
 
+OUTPUT_INSTANCES = 0
+OUTPUT_INSTANCER = 1
+
+SAMPLE_VERTICES = 0
+SAMPLE_SURFACE = 1
+
+SCATTER_CHUNK_SIZE = 500
+
+RECIPE_ATTR = "scatterRecipe"
+INDICES_ATTR = "scatterIndices"
+REBUILD_KEYS = ("seed", "source", "target_mesh", "target_digest",
+                "sampling_mode", "output_mode", "min_distance")
+TRANSFORM_KEYS = ("scatter_choice", "rotate_min", "rotate_max", "scale_min",
+                  "scale_max", "offset")
+
+
+def _profiled(name):
+    """Run a scatter generator method under a fresh ScatterProfiler."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self.profiler = scatterprofile.ScatterProfiler(
+                name, __version__, self.profile_memory)
+            return self.profiler.profile_run(method(self, *args, **kwargs),
+                                             sys.modules[__name__])
+        return wrapper
+    return decorator
+
+
+def _undoable(method):
+    """Make a scatter generator method undoable.
+
+    Driven to the end by ScatterObject.run_scatter, the whole run is one
+    undo chunk with redraws suspended throughout, so a single undo takes
+    it back. Stepped from a timer, each step gets its own chunk instead,
+    so the viewport redraws between steps and edits the artist makes
+    meanwhile stay out of the scatter's undo entries. A stepped run is
+    taken back as one undo by ScatterObject.remove_last_scatter.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        run = method(self, *args, **kwargs)
+        try:
+            while True:
+                with contextlib.ExitStack() as step:
+                    if not self._undo_chunk_open:
+                        step.enter_context(undo_chunk(method.__name__))
+                        step.enter_context(self.profiler.undo_chunk())
+                    try:
+                        progress = next(run)
+                    except StopIteration:
+                        return
+                yield progress
+        finally:
+            run.close()
+    return wrapper
+
+
+@contextlib.contextmanager
+def undo_chunk(name):
+    """Group every command in the block into a single undo entry.
+
+    Viewport redraws are suspended until the block ends, so instances are
+    not drawn one at a time as they are created.
+    """
+    cmds.undoInfo(openChunk=True, chunkName=name)
+    cmds.refresh(suspend=True)
+    try:
+        yield
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+
 
 def maya_main_window():
     """Return the maya main window widget"""
     main_window = omui.MQtUtil.mainWindow()
-    return wrapInstance(long(main_window), QtWidgets.QWidget)
+    return wrapInstance(int(main_window), QtWidgets.QWidget)
 
 
 class ScatterUI(QtWidgets.QDialog):
@@ -25,6 +113,9 @@ class ScatterUI(QtWidgets.QDialog):
         self.setFixedHeight(900)
         self.setWindowFlags(self.windowFlags() ^
                             QtCore.Qt.WindowContextHelpButtonHint)
+        self.scatter_timer = QtCore.QTimer(self)
+        self.scatter_run = None
+        self.scatter_start_time = 0
         self.scat_ui()
         self.connections()
         self.scatterobject = ScatterObject()
@@ -36,6 +127,8 @@ class ScatterUI(QtWidgets.QDialog):
         layout.addWidget(self.title)
         layout.addLayout(self.scatter_lay)
         layout.addLayout(self.align_to_normals_lay)
+        layout.addLayout(self.output_mode_lay)
+        layout.addLayout(self.surface_sampling_lay)
         layout.addLayout(self.xrot_rand_lay)
         layout.addLayout(self.yrot_rand_lay)
         layout.addLayout(self.zrot_rand_lay)
@@ -65,6 +158,8 @@ class ScatterUI(QtWidgets.QDialog):
     def ui_start(self):
         self.scatter_lay = self._scat_field_ui()
         self.align_to_normals_lay = self._align_to_normals_ui()
+        self.output_mode_lay = self._output_mode_ui()
+        self.surface_sampling_lay = self._surface_sampling_ui()
         self.xrot_rand_lay = self._xrot_ui()
         self.yrot_rand_lay = self._yrot_ui()
         self.zrot_rand_lay = self._zrot_ui()
@@ -81,6 +176,31 @@ class ScatterUI(QtWidgets.QDialog):
         self.scatter_obj_pb.clicked.connect(self._source_object_click)
         self.scatter_targ_pb.clicked.connect(self._dest_object_click)
         self.align_to_normals.clicked.connect(self._align_to_normals_click)
+        self.output_mode.currentIndexChanged.connect(self._output_mode_click)
+        self.bake_btn.clicked.connect(self._bake_click)
+        self.export_cache_btn.clicked.connect(self._export_cache_click)
+        self.load_cache_btn.clicked.connect(self._load_cache_click)
+        self.sample_surface.clicked.connect(self._sample_surface_click)
+        self.avoid_overlap.clicked.connect(self._avoid_overlap_click)
+        self.cancel_btn.clicked.connect(self._cancel_click)
+        self.remove_scatter_btn.clicked.connect(self._remove_scatter_click)
+        self.show_report_btn.clicked.connect(self._show_report_click)
+        self.export_report_btn.clicked.connect(self._export_report_click)
+        self.track_memory.clicked.connect(self._track_memory_click)
+        self.scatter_timer.timeout.connect(self._scatter_step)
+
+    def done(self, result):
+        self._release()
+        super(ScatterUI, self).done(result)
+
+    def closeEvent(self, event):
+        self._release()
+        super(ScatterUI, self).closeEvent(event)
+
+    def _release(self):
+        if self.scatter_run is not None:
+            self._cancel_click()
+        self.scatterobject.release()
 
     @QtCore.Slot()
     def _source_object_click(self):
@@ -94,10 +214,119 @@ class ScatterUI(QtWidgets.QDialog):
     def _align_to_normals_click(self):
         self._align_to_normals_check()
 
+    @QtCore.Slot()
+    def _output_mode_click(self):
+        self.scatterobject.output_mode = self.output_mode.currentIndex()
+
+    @QtCore.Slot()
+    def _sample_surface_click(self):
+        self._sample_surface_check()
+
+    @QtCore.Slot()
+    def _avoid_overlap_click(self):
+        self.scatterobject.avoid_overlap = self.avoid_overlap.isChecked()
+
+    @QtCore.Slot()
+    def _track_memory_click(self):
+        self.scatterobject.profile_memory = self.track_memory.isChecked()
+
+    @QtCore.Slot()
+    def _bake_click(self):
+        self.scatterobject.bake_instancer()
+
+    @QtCore.Slot()
+    def _export_cache_click(self):
+        path = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Export Scatter Cache",
+            filter="Scatter Cache (*{})".format(scattercache.EXTENSION))[0]
+        if not path:
+            return
+        self._user_input_values()
+        self.scatterobject.export_cache(path)
+
+    @QtCore.Slot()
+    def _load_cache_click(self):
+        path = QtWidgets.QFileDialog.getOpenFileName(
+            parent=self, caption="Load Scatter Cache",
+            filter="Scatter Cache (*{})".format(scattercache.EXTENSION))[0]
+        if not path:
+            return
+        self._start_scatter(self.scatterobject.iter_load_cache(path))
+
     @QtCore.Slot()
     def _scat_click(self):
         self._user_input_values()
-        self.scatterobject.scat_align_check()
+        object_grouping = None
+        if self.update_existing.isChecked():
+            object_grouping = self.scatterobject.find_scatter_group()
+        if object_grouping:
+            self._start_scatter(self.scatterobject.iter_update_scatter(
+                object_grouping))
+        else:
+            self._start_scatter(self.scatterobject.iter_scatter())
+
+    def _start_scatter(self, scatter_run):
+        self.scatter_run = scatter_run
+        self.scatter_start_time = time.time()
+        self.scatter_progress.setValue(0)
+        self.scatter_eta_lbl.setText("Starting...")
+        self._set_scatter_running(True)
+        self.scatter_timer.start(0)
+
+    @QtCore.Slot()
+    def _scatter_step(self):
+        """Apply one chunk of the running scatter and update the progress"""
+        try:
+            done, total = next(self.scatter_run)
+        except StopIteration:
+            self._finish_scatter("Done (seed {})".format(
+                self.scatterobject.scatter_seed))
+            return
+        except Exception:
+            self._finish_scatter("Failed")
+            raise
+        elapsed = time.time() - self.scatter_start_time
+        self.scatter_progress.setMaximum(total)
+        self.scatter_progress.setValue(done)
+        eta = elapsed / done * (total - done) if done else 0
+        self.scatter_eta_lbl.setText("{}/{} instances, {:.0f}s left".format(
+            done, total, eta))
+
+    @QtCore.Slot()
+    def _cancel_click(self):
+        self.scatter_run.close()
+        self.scatterobject.cancel_scatter()
+        self._finish_scatter("Cancelled")
+
+    @QtCore.Slot()
+    def _remove_scatter_click(self):
+        removed = self.scatterobject.remove_last_scatter()
+        self.scatter_eta_lbl.setText("Removed {} nodes".format(removed))
+
+    @QtCore.Slot()
+    def _show_report_click(self):
+        QtWidgets.QMessageBox.information(
+            self, "Scatter Report",
+            self.scatterobject.profiler.format_report())
+
+    @QtCore.Slot()
+    def _export_report_click(self):
+        path = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Export Scatter Report",
+            filter="JSON (*.json)")[0]
+        if path:
+            self.scatterobject.profiler.export_json(path)
+
+    def _finish_scatter(self, status):
+        self.scatter_timer.stop()
+        self.scatter_run = None
+        self.scatter_eta_lbl.setText(status)
+        self._set_scatter_running(False)
+
+    def _set_scatter_running(self, running):
+        self.scatter_btn.setEnabled(not running)
+        self.cancel_btn.setEnabled(running)
+        self.remove_scatter_btn.setEnabled(not running)
 
     def _scat_field_ui(self):
         layout = self._object_titles()
@@ -120,10 +349,65 @@ class ScatterUI(QtWidgets.QDialog):
         return layout
 
     def _align_to_normals_check(self):
-        if self.align_to_normals.isChecked():
-            self.scatterobject.scatter_choice = 1
+        aligned = self.align_to_normals.isChecked()
+        self.scatterobject.scatter_choice = 1 if aligned else 0
+        # Aligned instances only spin about the normal, their X axis.
+        for widget in (self.yrot_min, self.yrot_max, self.zrot_min,
+                       self.zrot_max):
+            widget.setEnabled(not aligned)
+
+    def _output_mode_ui(self):
+        layout = QtWidgets.QGridLayout()
+        self.output_mode_lbl = QtWidgets.QLabel("Output")
+        self.output_mode = QtWidgets.QComboBox()
+        self.output_mode.addItems(["Instances", "Point Instancer"])
+        self.output_mode.setFixedWidth(200)
+        self.bake_btn = QtWidgets.QPushButton("Bake to Instances")
+        self.bake_btn.setFixedWidth(200)
+        self.export_cache_btn = QtWidgets.QPushButton("Export Cache...")
+        self.export_cache_btn.setFixedWidth(200)
+        self.load_cache_btn = QtWidgets.QPushButton("Load Cache...")
+        self.load_cache_btn.setFixedWidth(200)
+        layout.addWidget(self.output_mode_lbl, 0, 0)
+        layout.addWidget(self.output_mode, 1, 0)
+        layout.addWidget(self.bake_btn, 1, 1)
+        layout.addWidget(self.export_cache_btn, 2, 0)
+        layout.addWidget(self.load_cache_btn, 2, 1)
+        return layout
+
+    def _surface_sampling_ui(self):
+        layout = QtWidgets.QGridLayout()
+        self.sample_surface = QtWidgets.QCheckBox("Scatter Across Surface")
+        self.min_distance_lbl = QtWidgets.QLabel("Min. Distance")
+        self.min_distance = QtWidgets.QDoubleSpinBox()
+        self.min_distance.setMinimum(0)
+        self.min_distance.setMaximum(100)
+        self.min_distance.setValue(0)
+        self.min_distance.setSingleStep(.1)
+        self.min_distance.setFixedWidth(200)
+        self.avoid_overlap = QtWidgets.QCheckBox("Avoid Overlaps")
+        layout.addWidget(self.sample_surface, 0, 0)
+        layout.addWidget(self.avoid_overlap, 0, 1)
+        self.density_lbl = QtWidgets.QLabel("Density Mask")
+        self.density_kind = QtWidgets.QComboBox()
+        self.density_kind.addItems(["None", "Color Set", "Vertex Attribute",
+                                    "Texture"])
+        self.density_kind.setFixedWidth(200)
+        self.density_name = QtWidgets.QLineEdit()
+        self.density_name.setPlaceholderText(
+            "Color set, attribute or texture name")
+        layout.addWidget(self.min_distance_lbl, 1, 0)
+        layout.addWidget(self.min_distance, 2, 0)
+        layout.addWidget(self.density_lbl, 3, 0)
+        layout.addWidget(self.density_kind, 4, 0)
+        layout.addWidget(self.density_name, 4, 1)
+        return layout
+
+    def _sample_surface_check(self):
+        if self.sample_surface.isChecked():
+            self.scatterobject.sampling_mode = SAMPLE_SURFACE
         else:
-            self.scatterobject.scatter_choice = 0
+            self.scatterobject.sampling_mode = SAMPLE_VERTICES
 
     def _xrot_ui(self):
         layout = QtWidgets.QGridLayout()
@@ -284,14 +568,25 @@ class ScatterUI(QtWidgets.QDialog):
         self.obj_embed_offset_lbl = QtWidgets.QLabel("Position Offset Value")
         self._vert_percent_spinbox()
         self._offset_spinbox()
+        self._seed_spinbox()
         layout.addWidget(self.selected_vert_lbl, 14, 0)
         layout.addWidget(self.obj_embed_offset_lbl, 16, 0)
         layout.addWidget(self.selected_vert_perc, 15, 0)
         layout.addWidget(self.obj_embed_offset, 17, 0)
+        layout.addWidget(self.seed_lbl, 18, 0)
+        layout.addWidget(self.seed_sbx, 19, 0)
         self.selected_vert_perc.setFixedWidth(200)
         self.obj_embed_offset.setFixedWidth(200)
+        self.seed_sbx.setFixedWidth(200)
         return layout
 
+    def _seed_spinbox(self):
+        self.seed_lbl = QtWidgets.QLabel("Seed")
+        self.seed_sbx = QtWidgets.QSpinBox()
+        self.seed_sbx.setMinimum(0)
+        self.seed_sbx.setMaximum(2 ** 31 - 1)
+        self.seed_sbx.setSpecialValueText("Random")
+
     def _offset_spinbox(self):
         self.obj_embed_offset = QtWidgets.QDoubleSpinBox()
         self.obj_embed_offset.setMinimum(-10)
@@ -311,7 +606,29 @@ class ScatterUI(QtWidgets.QDialog):
         layout = QtWidgets.QGridLayout()
         self.scatter_btn = QtWidgets.QPushButton("Scatter Object")
         self.scatter_btn.setFixedWidth(500)
+        self.cancel_btn = QtWidgets.QPushButton("Cancel")
+        self.cancel_btn.setFixedWidth(100)
+        self.cancel_btn.setEnabled(False)
+        self.scatter_progress = QtWidgets.QProgressBar()
+        self.scatter_progress.setFixedWidth(500)
+        self.scatter_eta_lbl = QtWidgets.QLabel("")
+        self.update_existing = QtWidgets.QCheckBox("Update Existing Scatter")
+        self.show_report_btn = QtWidgets.QPushButton("Show Report")
+        self.show_report_btn.setFixedWidth(100)
+        self.export_report_btn = QtWidgets.QPushButton("Export Report...")
+        self.export_report_btn.setFixedWidth(100)
+        self.track_memory = QtWidgets.QCheckBox("Track Memory")
+        self.remove_scatter_btn = QtWidgets.QPushButton("Remove Last")
+        self.remove_scatter_btn.setFixedWidth(100)
+        layout.addWidget(self.update_existing, 15, 0)
+        layout.addWidget(self.track_memory, 15, 1)
         layout.addWidget(self.scatter_btn, 16, 0)
+        layout.addWidget(self.cancel_btn, 16, 1)
+        layout.addWidget(self.scatter_progress, 17, 0)
+        layout.addWidget(self.show_report_btn, 17, 1)
+        layout.addWidget(self.scatter_eta_lbl, 18, 0)
+        layout.addWidget(self.export_report_btn, 18, 1)
+        layout.addWidget(self.remove_scatter_btn, 19, 1)
         return layout
 
     def _object_titles(self):
@@ -337,6 +654,10 @@ class ScatterUI(QtWidgets.QDialog):
         self.scatterobject.scat_scale_zmax = self.scale_zmax.value()
         self.scatterobject.scatter_percentage = self.selected_vert_perc.value()
         self.scatterobject.obj_pos_offset = self.obj_embed_offset.value()
+        self.scatterobject.min_distance = self.min_distance.value()
+        self.scatterobject.seed = self.seed_sbx.value()
+        self.scatterobject.density_source = scatterdensity.DensitySource(
+            self.density_kind.currentIndex(), self.density_name.text())
 
     def _select_source_object(self):
         self.scatterobject.choose_source_object()
@@ -347,16 +668,48 @@ class ScatterUI(QtWidgets.QDialog):
         self.scatter_targ.setText(str(self.scatterobject.current_target_def))
 
 
+def _common_prefix(old, new):
+    """Return how many leading entries two id arrays share."""
+    length = min(len(old), len(new))
+    differs = numpy.flatnonzero(old[:length] != new[:length])
+    return int(differs[0]) if len(differs) else length
+
+
 class ScatterObject(object):
 
     def __init__(self):
         self._init_scat()
         self.scatter_obj_def = None
         self.current_object_def = None
-        self.scatter_target_def = None
+        self.target_mesh = None
+        self.target_indices = numpy.zeros(0, dtype=numpy.int64)
         self.current_target_def = None
         self.scatter_choice = 0
+        self.output_mode = OUTPUT_INSTANCES
+        self.sampling_mode = SAMPLE_VERTICES
+        self.min_distance = 0
+        self.surface_samples = None
+        self.surface_sample_ids = numpy.zeros(0, dtype=numpy.int64)
+        self.point_ids = numpy.zeros(0, dtype=numpy.int64)
+        self.avoid_overlap = False
+        self.surface_sampler = None
+        self.density_source = scatterdensity.DensitySource()
+        self.seed = 0
+        self.scatter_seed = None
+        self.workers = 1
         self.obj_pos_offset = 0
+        self.scatter_group = None
+        self.updating_scatter = False
+        self.created_node_count = 0
+        self.created_nodes = []
+        self._undo_chunk_open = False
+        self.mesh_cache = scattermesh.MeshDataCache()
+        self.profile_memory = False
+        self.profiler = scatterprofile.ScatterProfiler()
+
+    def release(self):
+        """Remove the mesh watches, call when done with this object."""
+        self.mesh_cache.invalidate()
 
     def _init_scat(self):
         self.scat_x_min = 0
@@ -374,75 +727,588 @@ class ScatterObject(object):
         self.scatter_percentage = 0
 
     def scat_align_check(self):
-        if self.scatter_choice == 0:
-            self.select_random_vertices()
-            self.scatter_object()
-        elif self.scatter_choice == 1:
-            self.select_random_vertices()
-            self.align_normals()
-
-    def scatter_object(self):
-        object_grouping = cmds.group(empty=True, name="instance_group#")
-        for target in self.percentage_selection:
-            self.scatterObject = cmds.instance(self.current_object_def,
-                                               name=self.current_object_def
-                                                    + "_instance#")
-            cmds.parent(self.scatterObject, object_grouping)
-            x_point, y_point, z_point = cmds.pointPosition(target)
-            cmds.move(x_point, y_point, z_point, self.scatterObject)
-            self.random_rotation()
-            self.random_scale()
-
-    def align_normals(self):
-        object_grouping = cmds.group(empty=True, name="instance_group#")
-        for target in self.percentage_selection:
-            self.scatterObject = cmds.instance(self.current_object_def,
-                                               name=self.current_object_def
-                                               + "_instance#")
-            cmds.parent(self.scatterObject, object_grouping)
-            x_point, y_point, z_point = cmds.pointPosition(target)
-            cmds.move(x_point, y_point, z_point, self.scatterObject)
-            self.random_scale()
-            constraint = cmds.normalConstraint(self.scatter_target_def,
-                                               self.scatterObject)
-            cmds.delete(constraint)
-            self.offset_object()
-
-    def offset_object(self):
-        cmds.move(self.obj_pos_offset, 0, 0, self.scatterObject,
-                  objectSpace=True, relative=True)
+        self.run_scatter(self.iter_scatter())
+
+    def run_scatter(self, run):
+        """Run a scatter generator to the end as a single undo.
+
+        Args:
+            run (generator): From iter_scatter, iter_update_scatter or
+                iter_load_cache
+        """
+        self._undo_chunk_open = True
+        try:
+            with undo_chunk("scatter"), self.profiler.undo_chunk():
+                for _ in run:
+                    pass
+        finally:
+            self._undo_chunk_open = False
+
+    @_profiled("scatter")
+    @_undoable
+    def iter_scatter(self, chunk_size=SCATTER_CHUNK_SIZE):
+        """Run a scatter a bounded chunk of instances at a time.
+
+        Transforms are generated per chunk, so memory stays flat however
+        many points are scattered. The instancer output is a single write
+        and runs as one chunk. Each run is timed into `profiler`, and
+        undoes as described in _undoable.
+
+        Args:
+            chunk_size (int): The most instances created per step
+
+        Yields:
+            tuple: The number of points applied so far and the total
+        """
+        self.updating_scatter = False
+        # Only a group this run creates gets its recipe.
+        self.scatter_group = None
+        self.created_nodes = []
+        self.scatter_seed = self.seed or scatterengine.new_seed()
+        log.info("Scattering with seed %s", self.scatter_seed)
+        self.choose_scatter_points()
+        total = self.scatter_count()
+        output_mode = self.output_mode
+        if output_mode == OUTPUT_INSTANCER:
+            chunk_size = max(total, 1)
+        else:
+            self.new_scatter_group()
+        for start in range(0, total, chunk_size):
+            stop = min(start + chunk_size, total)
+            with self.profiler.phase("transforms"):
+                batch = self.transform_chunk(start, stop)
+            with self.profiler.phase("create"):
+                if output_mode == OUTPUT_INSTANCER:
+                    self.instancer_batch(batch)
+                else:
+                    self.instance_batch(batch, self.scatter_group)
+            yield stop, total
+        if self.scatter_group:
+            with self.profiler.phase("recipe"):
+                self.write_recipe(self.scatter_group)
+        log.info("Scattered %s points using %s new nodes",
+                 total, self.created_node_count)
+
+    @_profiled("update")
+    @_undoable
+    def iter_update_scatter(self, object_grouping=None,
+                            chunk_size=SCATTER_CHUNK_SIZE):
+        """Bring an existing scatter in line with the current settings.
+
+        The recipe stored on the group is compared with the current one.
+        Instances whose point is unchanged are kept, and only re-transformed
+        when a rotation, scale or offset setting changed. Instances past the
+        first differing point are deleted and the new points created, so a
+        percentage change only touches the difference. Changing the seed,
+        source, target or sampling rebuilds the group in place, as does
+        any change to an instancer scatter.
+
+        Args:
+            object_grouping (str): The scatter group to update. Defaults to
+                the group made by the last scatter.
+            chunk_size (int): The most instances touched per step
+
+        Yields:
+            tuple: The amount of work done so far and the total
+        """
+        object_grouping = object_grouping or self.scatter_group
+        with self.profiler.phase("recipe"):
+            old_recipe, old_indices = self.read_recipe(object_grouping)
+        self.scatter_group = object_grouping
+        self.updating_scatter = True
+        self.created_node_count = 0
+        self.created_nodes = []
+        self.scatter_seed = self.seed or old_recipe["seed"]
+        self.choose_scatter_points()
+        recipe = self.scatter_recipe()
+        indices = self.scatter_indices()
+        total = len(indices)
+        kept = 0
+        if not old_recipe.get("stale") and not any(
+                old_recipe.get(key) != recipe[key] for key in REBUILD_KEYS):
+            kept = _common_prefix(old_indices, indices)
+        retransform = kept and any(old_recipe.get(key) != recipe[key]
+                                   for key in TRANSFORM_KEYS)
+        old_recipe["stale"] = True
+        with self.profiler.phase("recipe"):
+            self.write_recipe(object_grouping, old_recipe, old_indices)
+        if self.output_mode == OUTPUT_INSTANCER:
+            kept = retransform = 0
+            chunk_size = max(total, 1)
+        children = cmds.listRelatives(object_grouping, children=True,
+                                      fullPath=True) or []
+        if children[kept:]:
+            with self.profiler.phase("delete"):
+                cmds.delete(children[kept:])
+        work = (kept if retransform else 0) + total - kept
+        done = 0
+        if retransform:
+            for start in range(0, kept, chunk_size):
+                stop = min(start + chunk_size, kept)
+                with self.profiler.phase("transforms"):
+                    batch = self.transform_chunk(start, stop)
+                with self.profiler.phase("retransform"):
+                    for child, matrix in zip(children[start:stop],
+                                             batch.matrices()):
+                        cmds.xform(child, matrix=matrix.ravel().tolist())
+                done += stop - start
+                yield done, work
+        for start in range(kept, total, chunk_size):
+            stop = min(start + chunk_size, total)
+            with self.profiler.phase("transforms"):
+                batch = self.transform_chunk(start, stop)
+            with self.profiler.phase("create"):
+                if self.output_mode == OUTPUT_INSTANCER:
+                    self.instancer_batch(batch, object_grouping)
+                else:
+                    self.instance_batch(batch, object_grouping)
+            done += stop - start
+            yield done, work
+        with self.profiler.phase("recipe"):
+            self.write_recipe(object_grouping)
+        log.info("Updated scatter: kept %s, re-transformed %s, removed %s, "
+                 "added %s", kept, kept if retransform else 0,
+                 len(children) - kept, total - kept)
+
+    @_profiled("load cache")
+    @_undoable
+    def iter_load_cache(self, path, chunk_size=SCATTER_CHUNK_SIZE):
+        """Apply a scatter cache file to the scene without recomputing it.
+
+        The cache is memory-mapped and read a chunk at a time. Its source
+        object is used when it still exists in the scene.
+
+        Yields:
+            tuple: The number of points applied so far and the total
+        """
+        with self.profiler.phase("read cache"):
+            layout = scattercache.read_cache(path)
+        source = layout.source
+        if not source or not cmds.objExists(source):
+            source = self.current_object_def
+        self.updating_scatter = False
+        self.scatter_group = None
+        self.created_nodes = []
+        total = len(layout)
+        output_mode = self.output_mode
+        if output_mode == OUTPUT_INSTANCER:
+            chunk_size = max(total, 1)
+        else:
+            self.new_scatter_group()
+        for start in range(0, total, chunk_size):
+            stop = min(start + chunk_size, total)
+            with self.profiler.phase("create"):
+                if output_mode == OUTPUT_INSTANCER:
+                    self.instancer_batch(layout.batch, source=source)
+                else:
+                    self.instance_batch(layout.batch[start:stop],
+                                        self.scatter_group, source=source)
+            yield stop, total
+        if self.scatter_group and "target_mesh" in layout.recipe:
+            recipe = dict(layout.recipe, output_mode=output_mode)
+            with self.profiler.phase("recipe"):
+                self.write_recipe(self.scatter_group, recipe, layout.indices)
+        log.info("Loaded %s points from %s", total, path)
+
+    def export_cache(self, path):
+        """Generate the current scatter settings straight to a cache file.
+
+        Nothing is created in the scene, so large layouts can be built and
+        shared before anyone applies them.
+        """
+        self.scatter_seed = self.seed or scatterengine.new_seed()
+        self.choose_scatter_points()
+        batch = self.transform_chunk(0, self.scatter_count())
+        scattercache.write_cache(path, scattercache.ScatterLayout(
+            batch, self.scatter_indices(), self.current_object_def,
+            self.scatter_recipe()))
+
+    def choose_scatter_points(self):
+        """Pick the scatter points with the current sampling mode."""
+        with self.profiler.phase("selection"):
+            if self.sampling_mode == SAMPLE_SURFACE:
+                self.sample_surface_points()
+            else:
+                self.select_random_vertices()
+        if self.density_source:
+            with self.profiler.phase("density"):
+                self.apply_density()
+        if self.avoid_overlap:
+            with self.profiler.phase("overlap"):
+                self.remove_overlaps()
+
+    def apply_density(self):
+        """Thin the points by the density painted on the destination.
+
+        Densities are read from the mesh once and cached with its other
+        arrays. Surface points blend the densities of their triangle.
+        """
+        mesh_data = self.mesh_cache.get(self.target_mesh)
+        densities = self.density_source.vertex_density(mesh_data)
+        if self.sampling_mode == SAMPLE_SURFACE:
+            densities = self.surface_sampler.interpolate(
+                densities, self.surface_samples.triangle_ids,
+                self.surface_samples.barycentrics)
+        else:
+            densities = densities[self.percentage_selection]
+        count = self.scatter_count()
+        self.keep_points(scatterdensity.accept_points(
+            densities, self.scatter_seed, self.point_ids))
+        log.info("Density mask removed %s points",
+                 count - self.scatter_count())
+
+    def remove_overlaps(self):
+        """Drop points whose instance would intersect an earlier one.
+
+        Each instance is bounded by a sphere around its pivot that holds
+        the source's bounding box at the instance's random scale.
+        """
+        count = self.scatter_count()
+        batch = self.transform_chunk(0, count)
+        radii = numpy.linalg.norm(self.source_extent() * batch.scales, axis=1)
+        kept = scattersample.overlap_filter(batch.translations, radii)
+        self.keep_points(kept)
+        log.info("Removed %s overlapping points", count - len(kept))
+
+    def keep_points(self, kept):
+        """Reduce the chosen points to the positions in `kept`."""
+        self.point_ids = self.point_ids[kept]
+        if self.sampling_mode == SAMPLE_SURFACE:
+            self.surface_samples = self.surface_samples.subset(kept)
+            self.surface_sample_ids = self.surface_sample_ids[kept]
+        else:
+            self.percentage_selection = self.percentage_selection[kept]
+            self.select_scatter_vertices()
+
+    def source_extent(self):
+        """Return how far the source reaches from its pivot on each axis."""
+        shapes = cmds.listRelatives(self.current_object_def, shapes=True,
+                                    fullPath=True)
+        shape = shapes[0] if shapes else self.current_object_def
+        bounds_min = numpy.array(cmds.getAttr(shape + ".boundingBoxMin")[0])
+        bounds_max = numpy.array(cmds.getAttr(shape + ".boundingBoxMax")[0])
+        return numpy.maximum(numpy.abs(bounds_min), numpy.abs(bounds_max))
+
+    def scatter_indices(self):
+        """Return the ids of the chosen points in scatter order.
+
+        These are vertex ids when scattering on vertices, and sample
+        numbers when scattering across the surface.
+        """
+        if self.sampling_mode == SAMPLE_SURFACE:
+            return self.surface_sample_ids
+        return self.percentage_selection
+
+    def scatter_recipe(self):
+        """Return the settings that produced the current scatter."""
+        return {
+            "seed": self.scatter_seed,
+            "source": self.current_object_def,
+            "target_mesh": self.target_mesh,
+            "target_digest": hashlib.md5(
+                numpy.ascontiguousarray(self.target_indices,
+                                        dtype=numpy.int64)).hexdigest(),
+            "sampling_mode": self.sampling_mode,
+            "output_mode": self.output_mode,
+            "min_distance": float(self.min_distance),
+            "avoid_overlap": self.avoid_overlap,
+            "density_source": [self.density_source.kind,
+                               self.density_source.name],
+            "scatter_percentage": self.scatter_percentage,
+            "scatter_choice": self.scatter_choice,
+            "rotate_min": [self.scat_x_min, self.scat_y_min, self.scat_z_min],
+            "rotate_max": [self.scat_x_max, self.scat_y_max, self.scat_z_max],
+            "scale_min": [self.scat_scale_xmin, self.scat_scale_ymin,
+                          self.scat_scale_zmin],
+            "scale_max": [self.scat_scale_xmax, self.scat_scale_ymax,
+                          self.scat_scale_zmax],
+            "offset": float(self.obj_pos_offset),
+        }
+
+    def write_recipe(self, object_grouping, recipe=None, indices=None):
+        """Store a scatter recipe and its point ids on the scatter group."""
+        if recipe is None:
+            recipe = self.scatter_recipe()
+        if indices is None:
+            indices = self.scatter_indices()
+        if not cmds.attributeQuery(RECIPE_ATTR, node=object_grouping,
+                                   exists=True):
+            cmds.addAttr(object_grouping, longName=RECIPE_ATTR,
+                         dataType="string")
+            cmds.addAttr(object_grouping, longName=INDICES_ATTR,
+                         dataType="Int32Array")
+        cmds.setAttr(object_grouping + "." + RECIPE_ATTR, json.dumps(recipe),
+                     type="string")
+        cmds.setAttr(object_grouping + "." + INDICES_ATTR,
+                     numpy.asarray(indices).tolist(), type="Int32Array")
+
+    def read_recipe(self, object_grouping):
+        """Return the recipe dict and point ids stored on a scatter group."""
+        recipe = json.loads(cmds.getAttr(object_grouping + "." + RECIPE_ATTR))
+        indices = cmds.getAttr(object_grouping + "." + INDICES_ATTR) or []
+        return recipe, numpy.array(indices, dtype=numpy.int64)
+
+    def find_scatter_group(self):
+        """Return the selected scatter group, or the last one made here."""
+        for node in cmds.ls(selection=True, transforms=True) or []:
+            if cmds.attributeQuery(RECIPE_ATTR, node=node, exists=True):
+                return node
+        if self.scatter_group and cmds.objExists(self.scatter_group) and \
+                cmds.attributeQuery(RECIPE_ATTR, node=self.scatter_group,
+                                    exists=True):
+            return self.scatter_group
+        return None
+
+    def cancel_scatter(self):
+        """Delete whatever an unfinished iter_scatter has created.
+
+        A cancelled update keeps its group, which is left marked stale so
+        the next update rebuilds it.
+        """
+        if self.updating_scatter:
+            log.warning("Update cancelled, %s is partially updated.",
+                        self.scatter_group)
+            return
+        if self.scatter_group and cmds.objExists(self.scatter_group):
+            cmds.delete(self.scatter_group)
+        self.scatter_group = None
+        self.created_node_count = 0
+        self.created_nodes = []
+
+    def remove_last_scatter(self):
+        """Delete every node the last scatter, update or cache load made.
+
+        Each step of a run stepped from the UI is undone on its own, so
+        this takes a whole run back as one undo. An update's group is kept
+        and marked stale, as the instances it replaced are not restored.
+
+        Returns:
+            int: The number of nodes deleted
+        """
+        nodes = [node for node in self.created_nodes if cmds.objExists(node)]
+        if not nodes:
+            return 0
+        with undo_chunk("remove_last_scatter"):
+            cmds.delete(nodes)
+            group = self.scatter_group
+            if group and cmds.objExists(group) and cmds.attributeQuery(
+                    RECIPE_ATTR, node=group, exists=True):
+                recipe, indices = self.read_recipe(group)
+                recipe["stale"] = True
+                self.write_recipe(group, recipe, indices)
+        if self.scatter_group in nodes:
+            self.scatter_group = None
+        self.created_nodes = []
+        self.created_node_count = 0
+        return len(nodes)
+
+    def transform_chunk(self, start, stop):
+        """Build the transforms for scatter points `start` to `stop`."""
+        positions = self.scatter_positions(start, stop)
+        ids = self.point_ids[start:stop]
+        if self.scatter_choice == 1:
+            return self.build_transforms(
+                positions, offset=self.obj_pos_offset,
+                normals=self.scatter_normals(start, stop), ids=ids)
+        return self.build_transforms(positions, ids=ids)
+
+    def scatter_count(self):
+        """Return how many points the current selection will scatter."""
+        if self.sampling_mode == SAMPLE_SURFACE:
+            return len(self.surface_samples)
+        return len(self.percentage_selection)
+
+    def scatter_positions(self, start=0, stop=None):
+        """Return the (N, 3) positions chosen for this scatter."""
+        if self.sampling_mode == SAMPLE_SURFACE:
+            return self.surface_samples.positions[start:stop]
+        mesh_data = self.mesh_cache.get(self.target_mesh)
+        return mesh_data.positions[self.percentage_selection[start:stop]]
+
+    def scatter_normals(self, start=0, stop=None):
+        """Return the (N, 3) surface normals at the scatter positions."""
+        if self.sampling_mode == SAMPLE_SURFACE:
+            return self.surface_samples.normals[start:stop]
+        mesh_data = self.mesh_cache.get(self.target_mesh)
+        return mesh_data.normals[self.percentage_selection[start:stop]]
+
+    def new_scatter_group(self):
+        """Create the empty group that holds a new scatter."""
+        self.scatter_group = cmds.group(empty=True, name="instance_group#")
+        self.created_node_count = 1
+        self.created_nodes = [self.scatter_group]
+        return self.scatter_group
+
+    def instance_batch(self, batch, object_grouping=None, source=None):
+        """Create one instance of the source object per batch transform.
+
+        The whole batch is parented under the group in a single command.
+        """
+        source = source or self.current_object_def
+        if object_grouping is None:
+            object_grouping = self.new_scatter_group()
+        if not len(batch):
+            return
+        instances = [cmds.instance(source, name=source + "_instance#")[0]
+                     for _ in range(len(batch))]
+        instances = cmds.parent(instances, object_grouping)
+        for instance, matrix in zip(instances, batch.matrices()):
+            cmds.xform(instance, matrix=matrix.ravel().tolist())
+        self.created_node_count += len(batch)
+        if object_grouping not in self.created_nodes:
+            self.created_nodes.extend(instances)
+
+    def instancer_batch(self, batch, object_grouping=None, source=None):
+        """Write the whole batch as per-point arrays on one instancer.
+
+        The points live on a static particle shape whose rotationPP and
+        scalePP arrays drive a particleInstancer, so the scene gains a
+        handful of nodes however many points are scattered.
+        """
+        source = source or self.current_object_def
+        if object_grouping is None:
+            object_grouping = self.new_scatter_group()
+        particle, shape = cmds.particle(
+            position=batch.translations.tolist(), name=source + "_points#")
+        cmds.setAttr(shape + ".isDynamic", False)
+        for attribute, values in (("rotationPP", batch.rotations),
+                                  ("scalePP", batch.scales)):
+            cmds.addAttr(shape, longName=attribute, dataType="vectorArray")
+            cmds.addAttr(shape, longName=attribute + "0",
+                         dataType="vectorArray")
+            cmds.setAttr(shape + "." + attribute, len(values),
+                         *values.tolist(), type="vectorArray")
+        cmds.saveInitialState(shape)
+        instancer = cmds.particleInstancer(
+            shape, addObject=True, object=source, position="position",
+            rotation="rotationPP", scale="scalePP",
+            name=source + "_instancer#")
+        nodes = cmds.parent(particle, instancer, object_grouping)
+        self.created_node_count += 3
+        if object_grouping not in self.created_nodes:
+            self.created_nodes.extend(nodes)
+
+    def bake_instancer(self, object_grouping=None):
+        """Replace an instancer scatter with real instances.
+
+        Args:
+            object_grouping (str): The scatter group to bake. Defaults to
+                the group made by the last scatter.
+        """
+        object_grouping = object_grouping or self.scatter_group
+        with undo_chunk("bake_instancer"):
+            self._bake_instancer(object_grouping)
+
+    def _bake_instancer(self, object_grouping):
+        shapes = cmds.listRelatives(object_grouping, allDescendents=True,
+                                    fullPath=True, type="particle") or []
+        for shape in shapes:
+            batch = scatterengine.TransformBatch(
+                cmds.getAttr(shape + ".position"),
+                cmds.getAttr(shape + ".rotationPP"),
+                cmds.getAttr(shape + ".scalePP"))
+            instancers = cmds.listConnections(shape, type="instancer") or []
+            sources = cmds.listConnections(instancers[0] + ".inputHierarchy",
+                                           source=True)
+            cmds.delete(instancers, cmds.listRelatives(shape, parent=True,
+                                                       fullPath=True))
+            self.instance_batch(batch, object_grouping, source=sources[0])
+        if cmds.attributeQuery(RECIPE_ATTR, node=object_grouping,
+                               exists=True):
+            recipe, indices = self.read_recipe(object_grouping)
+            recipe["output_mode"] = OUTPUT_INSTANCES
+            self.write_recipe(object_grouping, recipe, indices)
 
     def choose_source_object(self):
         self.scatter_obj_def = cmds.ls(os=True, o=True)
         self.current_object_def = self.scatter_obj_def[-1]
 
     def choose_dest_object(self):
-        selection = cmds.ls(os=True, fl=True)
-        self.scatter_target_def = cmds.polyListComponentConversion(
-            selection, toVertex=True)
-        self.scatter_target_def = cmds.filterExpand(self.scatter_target_def,
-                                                    selectionMask=31)
-        self.current_target_def = self.scatter_target_def
+        selection = cmds.ls(os=True)
+        vertices = cmds.polyListComponentConversion(selection,
+                                                    toVertex=True) or []
+        vertex_ranges = scattermesh.parse_vertex_ranges(
+            vertices, lambda mesh: self.mesh_cache.get(mesh).vertex_count)
+        if not vertex_ranges:
+            log.warning("Select a mesh or some of its components.")
+            return
+        self.target_mesh = selection[-1].split(".")[0]
+        if self.target_mesh not in vertex_ranges:
+            self.target_mesh = sorted(vertex_ranges)[0]
+        if len(vertex_ranges) > 1:
+            log.warning("Several meshes selected, scattering onto %s only.",
+                        self.target_mesh)
+        self.target_indices = vertex_ranges[self.target_mesh]
+        self.mesh_cache.retain([self.target_mesh])
+        self.current_target_def = "{} ({} vertices)".format(
+            self.target_mesh, len(self.target_indices))
 
     def select_random_vertices(self):
-        random_amount = int(round(len(self.scatter_target_def)
+        random_amount = int(round(len(self.target_indices)
+                                  * (self.scatter_percentage * 0.01)))
+        rng = scatterengine.stream_rng(self.scatter_seed,
+                                       scatterengine.SELECTION_STREAM)
+        self.percentage_selection = rng.permutation(
+            self.target_indices)[:random_amount]
+        self.point_ids = numpy.arange(random_amount, dtype=numpy.int64)
+        self.select_scatter_vertices()
+
+    def select_scatter_vertices(self):
+        vertex_ranges = scattermesh.format_vertex_ranges(
+            self.target_mesh, self.percentage_selection)
+        if vertex_ranges:
+            cmds.select(vertex_ranges, replace=True)
+        else:
+            cmds.select(clear=True)
+
+    def sample_surface_points(self):
+        """Scatter points across the faces covered by the destination.
+
+        Points land anywhere on those faces with density proportional to
+        area, and are thinned to `min_distance` spacing when it is set.
+        """
+        mesh_data = self.mesh_cache.get(self.target_mesh)
+        selected = numpy.zeros(mesh_data.vertex_count, dtype=bool)
+        selected[self.target_indices] = True
+        triangles = mesh_data.triangles[
+            selected[mesh_data.triangles].all(axis=1)]
+        random_amount = int(round(len(self.target_indices)
                                   * (self.scatter_percentage * 0.01)))
-        self.percentage_selection = random.sample(self.scatter_target_def,
-                                                  k=random_amount)
-        cmds.select(self.percentage_selection)
-
-    def random_rotation(self):
-        x_rot = random.uniform(self.scat_x_min, self.scat_x_max)
-        y_rot = random.uniform(self.scat_y_min, self.scat_y_max)
-        z_rot = random.uniform(self.scat_z_min, self.scat_z_max)
-        cmds.rotate(x_rot, y_rot, z_rot, self.scatterObject)
-
-    def random_scale(self):
-        scale_factor_x = random.uniform(self.scat_scale_xmin,
-                                        self.scat_scale_xmax)
-        scale_factor_y = random.uniform(self.scat_scale_ymin,
-                                        self.scat_scale_ymax)
-        scale_factor_z = random.uniform(self.scat_scale_zmin,
-                                        self.scat_scale_zmax)
-        cmds.scale(scale_factor_x, scale_factor_y, scale_factor_z,
-                   self.scatterObject)
\ No newline at end of file
+        if not len(triangles):
+            log.warning("No faces of %s are fully selected.",
+                        self.target_mesh)
+            random_amount = 0
+        self.surface_sampler = scattersample.SurfaceSampler(
+            mesh_data.positions, triangles, mesh_data.normals)
+        samples = self.surface_sampler.sample(random_amount,
+                                              self.scatter_seed)
+        self.surface_sample_ids = scattersample.poisson_filter(
+            samples.positions, self.min_distance)
+        self.surface_samples = samples.subset(self.surface_sample_ids)
+        self.point_ids = self.surface_sample_ids
+
+    def build_transforms(self, positions, offset=0.0, normals=None, ids=None):
+        """Generate every instance transform for `positions` in one batch.
+
+        Passing `normals` aligns each instance to the surface the same way
+        a normalConstraint would, without creating any constraint nodes,
+        and only the X rotation range applies, as a spin about the normal.
+        Transforms come from `scatter_seed` and the point `ids`, split
+        across `workers` processes when there is more than one.
+
+        Returns:
+            scatterengine.TransformBatch: One transform per position
+        """
+        return scatterengine.generate_transforms_parallel(
+            positions,
+            rotate_min=(self.scat_x_min, self.scat_y_min, self.scat_z_min),
+            rotate_max=(self.scat_x_max, self.scat_y_max, self.scat_z_max),
+            scale_min=(self.scat_scale_xmin, self.scat_scale_ymin,
+                       self.scat_scale_zmin),
+            scale_max=(self.scat_scale_xmax, self.scat_scale_ymax,
+                       self.scat_scale_zmax),
+            offset=offset,
+            normals=normals,
+            seed=self.scatter_seed,
+            ids=ids,
+            workers=self.workers)
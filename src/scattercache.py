@@ -0,0 +1,182 @@
+import argparse
+import json
+import logging
+import struct
+
+import numpy
+
+import fileutil
+import scatterengine
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SCATTER\x00"
+VERSION = 1
+ALIGNMENT = 64
+EXTENSION = ".scatter"
+_PREAMBLE = struct.Struct("<8sII")
+
+
+class ScatterLayout(object):
+    """A finished scatter: transforms plus what they were made from."""
+
+    def __init__(self, batch, indices=None, source=None, recipe=None):
+        self.batch = batch
+        if indices is None:
+            indices = numpy.arange(len(batch), dtype=numpy.int64)
+        self.indices = indices
+        self.source = source
+        self.recipe = recipe or {}
+
+    def __len__(self):
+        return len(self.batch)
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_cache(path, layout):
+    """Write a layout to a cache file.
+
+    The file is a fixed preamble, a JSON header describing each array and
+    then the raw little-endian arrays, each aligned to ALIGNMENT bytes so
+    they can be memory-mapped straight back. It is written to a temporary
+    file first and renamed into place.
+
+    Args:
+        path (str): Where to write the cache
+        layout (ScatterLayout): The scatter to store
+    """
+    arrays = [("indices", numpy.asarray(layout.indices, dtype="<i8")),
+              ("translations", layout.batch.translations.astype("<f8")),
+              ("rotations", layout.batch.rotations.astype("<f8")),
+              ("scales", layout.batch.scales.astype("<f8"))]
+    header = {"source": layout.source, "recipe": layout.recipe,
+              "count": len(layout), "arrays": {}}
+    # The header holds the array offsets, which depend on the header size,
+    # so reserve room for it before placing the arrays.
+    reserved = len(json.dumps(header)) + 128 * len(arrays) + ALIGNMENT
+    offset = _aligned(_PREAMBLE.size + reserved)
+    for name, array in arrays:
+        header["arrays"][name] = {"dtype": array.dtype.str,
+                                  "shape": list(array.shape),
+                                  "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode("utf-8")
+    if _PREAMBLE.size + len(header_bytes) > header["arrays"]["indices"][
+            "offset"]:
+        raise ValueError("Scatter cache header is too large")
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as cache_file:
+        cache_file.write(_PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        cache_file.write(header_bytes)
+        for name, array in arrays:
+            cache_file.seek(header["arrays"][name]["offset"])
+            array.tofile(cache_file)
+        cache_file.truncate(offset)
+    fileutil.replace(temp_path, path)
+    log.info("Wrote %s points to %s", len(layout), path)
+
+
+def read_cache(path):
+    """Memory-map a cache file written by write_cache.
+
+    Nothing is copied or recomputed: the arrays of the returned layout
+    read straight from the file as they are used.
+
+    Returns:
+        ScatterLayout: The stored scatter
+    """
+    with open(path, "rb") as cache_file:
+        magic, version, header_length = _PREAMBLE.unpack(
+            cache_file.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a scatter cache".format(path))
+        if version > VERSION:
+            raise ValueError("{} needs a newer scatter tool (version {})"
+                             .format(path, version))
+        header = json.loads(cache_file.read(header_length).decode("utf-8"))
+    arrays = {}
+    for name, info in header["arrays"].items():
+        shape = tuple(info["shape"])
+        if not shape[0]:
+            arrays[name] = numpy.zeros(shape, dtype=info["dtype"])
+            continue
+        arrays[name] = numpy.memmap(path, dtype=info["dtype"], mode="r",
+                                    offset=info["offset"], shape=shape)
+    batch = scatterengine.TransformBatch(arrays["translations"],
+                                         arrays["rotations"],
+                                         arrays["scales"])
+    return ScatterLayout(batch, arrays["indices"], header["source"],
+                         header["recipe"])
+
+
+def load_point_cloud(path):
+    """Read points, and normals if present, from a .npy or text file.
+
+    Rows hold "x y z" or "x y z nx ny nz".
+
+    Returns:
+        tuple: An (N, 3) positions array and an (N, 3) normals array or None
+    """
+    if path.endswith(".npy"):
+        points = numpy.load(path, mmap_mode="r")
+    else:
+        points = numpy.loadtxt(path, dtype=numpy.float64, ndmin=2)
+    normals = points[:, 3:6] if points.shape[1] >= 6 else None
+    return points[:, :3], normals
+
+
+def layout_from_points(positions, normals=None, seed=None, source=None,
+                       workers=None, **ranges):
+    """Build a layout for a point cloud without Maya.
+
+    Args:
+        positions (numpy.ndarray): An (N, 3) array of points
+        normals (numpy.ndarray): Optional normals to align to
+        seed (int): The scatter seed, a fresh one if None
+        source (str): Name of the object the layout will instance
+        workers (int): Processes used to build the transforms
+        ranges: rotate_min, rotate_max, scale_min, scale_max and offset as
+            accepted by scatterengine.generate_transforms
+
+    Returns:
+        ScatterLayout: The generated layout
+    """
+    seed = seed or scatterengine.new_seed()
+    batch = scatterengine.generate_transforms_parallel(
+        positions, normals=normals, seed=seed, workers=workers, **ranges)
+    recipe = dict((key, list(value) if isinstance(value, tuple) else value)
+                  for key, value in ranges.items())
+    recipe["seed"] = seed
+    return ScatterLayout(batch, source=source, recipe=recipe)
+
+
+def main(argv=None):
+    """Generate a cache file from a point cloud on the command line."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("points", help="A .npy or whitespace text file")
+    parser.add_argument("cache", help="The cache file to write")
+    parser.add_argument("--source", help="Object the layout instances")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--rotate-min", type=float, nargs=3, default=[0] * 3)
+    parser.add_argument("--rotate-max", type=float, nargs=3,
+                        default=[360] * 3)
+    parser.add_argument("--scale-min", type=float, nargs=3, default=[1] * 3)
+    parser.add_argument("--scale-max", type=float, nargs=3, default=[1] * 3)
+    parser.add_argument("--offset", type=float, default=0.0)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+    positions, normals = load_point_cloud(args.points)
+    layout = layout_from_points(
+        positions, normals, seed=args.seed, source=args.source,
+        workers=args.workers, rotate_min=args.rotate_min,
+        rotate_max=args.rotate_max, scale_min=args.scale_min,
+        scale_max=args.scale_max, offset=args.offset)
+    write_cache(args.cache, layout)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,86 @@
+import numpy
+
+import scatterengine
+import scattermesh
+
+DENSITY_NONE = 0
+DENSITY_COLOR_SET = 1
+DENSITY_ATTRIBUTE = 2
+DENSITY_TEXTURE = 3
+
+
+class DensitySource(object):
+    """Where per-vertex scatter density is read from.
+
+    Args:
+        kind (int): One of the DENSITY_* constants
+        name (str): The color set, per-vertex attribute or texture node
+        uv_set (str): The UV set a texture is sampled with, the current
+            one if None
+    """
+
+    def __init__(self, kind=DENSITY_NONE, name=None, uv_set=None):
+        self.kind = kind
+        self.name = name
+        self.uv_set = uv_set
+
+    def __bool__(self):
+        return self.kind != DENSITY_NONE and bool(self.name)
+
+    __nonzero__ = __bool__
+
+    @property
+    def key(self):
+        return ("density", self.kind, self.name, self.uv_set)
+
+    def load(self, mesh_data):
+        """Read this source for a whole mesh in one bulk query.
+
+        Returns:
+            numpy.ndarray: An (N,) array of densities clipped to 0-1
+        """
+        backend = mesh_data.backend
+        if self.kind == DENSITY_COLOR_SET:
+            colors = backend.vertex_colors(mesh_data.mesh, self.name)
+            values = colors[:, :3].dot(scattermesh.LUMINANCE)
+        elif self.kind == DENSITY_ATTRIBUTE:
+            values = backend.vertex_weights(mesh_data.mesh, self.name)
+            if len(values) != mesh_data.vertex_count:
+                raise ValueError("{} has {} weights for {} vertices".format(
+                    self.name, len(values), mesh_data.vertex_count))
+        elif self.kind == DENSITY_TEXTURE:
+            uvs = backend.vertex_uvs(mesh_data.mesh, self.uv_set)
+            values = backend.sample_texture(self.name, uvs)
+        else:
+            values = numpy.ones(mesh_data.vertex_count)
+        return numpy.clip(values, 0.0, 1.0)
+
+    def vertex_density(self, mesh_data):
+        """Return the per-vertex densities of a mesh.
+
+        Color sets and attributes live on the mesh, so they are cached
+        until it changes. A texture can be repainted or reloaded without
+        dirtying the mesh, so it is sampled again on every run.
+        """
+        if self.kind == DENSITY_TEXTURE:
+            return self.load(mesh_data)
+        return mesh_data.derived(self.key, self.load)
+
+
+def accept_points(densities, seed, ids):
+    """Keep each point with a probability equal to its density.
+
+    The decision for a point only depends on the seed and its id, so it
+    does not change when other points are added or removed.
+
+    Args:
+        densities (numpy.ndarray): The (N,) density at each point
+        seed (int): The scatter seed
+        ids (numpy.ndarray): The (N,) point ids
+
+    Returns:
+        numpy.ndarray: The indices of the accepted points
+    """
+    draws = scatterengine.unit_draws_at(seed, ids, 1,
+                                        scatterengine.DENSITY_STREAM)
+    return numpy.flatnonzero(draws[:, 0] < densities)
@@ -0,0 +1,316 @@
+import multiprocessing
+
+import numpy
+
+STREAM_CHUNK_SIZE = 4096
+TRANSFORM_STREAM = 0
+SELECTION_STREAM = 1
+DENSITY_STREAM = 2
+
+AIM_VECTOR = (1.0, 0.0, 0.0)
+UP_VECTOR = (0.0, 1.0, 0.0)
+WORLD_UP_VECTOR = (0.0, 1.0, 0.0)
+
+
+def new_seed():
+    """Return a fresh random seed small enough to show in a spin box."""
+    return int(numpy.random.SeedSequence().entropy % (2 ** 31 - 1)) + 1
+
+
+def stream_rng(seed, stream, chunk_index=0):
+    """Return the generator for one independent chunk of a seeded stream.
+
+    Every (stream, chunk_index) pair gets its own child of the seed, so a
+    chunk draws the same numbers whichever process or step asks for it.
+    """
+    return numpy.random.default_rng(numpy.random.SeedSequence(
+        seed, spawn_key=(stream, chunk_index)))
+
+
+def unit_draws(seed, start, stop, width, stream=TRANSFORM_STREAM):
+    """Return uniform [0, 1) numbers for the points `start` to `stop`.
+
+    Points are grouped in blocks of STREAM_CHUNK_SIZE and each block reads
+    from its own stream, so the numbers for a point only depend on the
+    seed and the point's position in the scatter.
+
+    Args:
+        seed (int): The scatter seed
+        start (int): Index of the first point
+        stop (int): Index one past the last point
+        width (int): How many numbers each point needs
+
+    Returns:
+        numpy.ndarray: A (stop - start, width) array
+    """
+    draws = numpy.empty((stop - start, width), dtype=numpy.float64)
+    if stop <= start:
+        return draws
+    for chunk in range(start // STREAM_CHUNK_SIZE,
+                       (stop - 1) // STREAM_CHUNK_SIZE + 1):
+        chunk_start = chunk * STREAM_CHUNK_SIZE
+        values = stream_rng(seed, stream, chunk).random(
+            (STREAM_CHUNK_SIZE, width))
+        low = max(start, chunk_start)
+        high = min(stop, chunk_start + STREAM_CHUNK_SIZE)
+        draws[low - start:high - start] = values[low - chunk_start:
+                                                 high - chunk_start]
+    return draws
+
+
+def unit_draws_at(seed, ids, width, stream=TRANSFORM_STREAM):
+    """Return the unit_draws numbers for an arbitrary array of point ids.
+
+    Args:
+        seed (int): The scatter seed
+        ids (numpy.ndarray): The points to draw for, in any order
+        width (int): How many numbers each point needs
+
+    Returns:
+        numpy.ndarray: A (len(ids), width) array
+    """
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    draws = numpy.empty((len(ids), width), dtype=numpy.float64)
+    chunks = ids // STREAM_CHUNK_SIZE
+    for chunk in numpy.unique(chunks).tolist():
+        rows = chunks == chunk
+        values = stream_rng(seed, stream, chunk).random(
+            (STREAM_CHUNK_SIZE, width))
+        draws[rows] = values[ids[rows] - chunk * STREAM_CHUNK_SIZE]
+    return draws
+
+
+def euler_to_matrices(rotations):
+    """Convert XYZ Euler angles in degrees into rotation matrices.
+
+    Matrices use Maya's row-vector convention with the default xyz rotate
+    order, so they can be written straight into a transform.
+
+    Args:
+        rotations (numpy.ndarray): An (N, 3) array of angles in degrees
+
+    Returns:
+        numpy.ndarray: An (N, 3, 3) array of rotation matrices
+    """
+    radians = numpy.radians(numpy.asarray(rotations, dtype=numpy.float64))
+    cos = numpy.cos(radians)
+    sin = numpy.sin(radians)
+    cx, cy, cz = cos[:, 0], cos[:, 1], cos[:, 2]
+    sx, sy, sz = sin[:, 0], sin[:, 1], sin[:, 2]
+    matrices = numpy.empty((len(radians), 3, 3), dtype=numpy.float64)
+    matrices[:, 0, 0] = cy * cz
+    matrices[:, 0, 1] = cy * sz
+    matrices[:, 0, 2] = -sy
+    matrices[:, 1, 0] = sx * sy * cz - cx * sz
+    matrices[:, 1, 1] = sx * sy * sz + cx * cz
+    matrices[:, 1, 2] = sx * cy
+    matrices[:, 2, 0] = cx * sy * cz + sx * sz
+    matrices[:, 2, 1] = cx * sy * sz - sx * cz
+    matrices[:, 2, 2] = cx * cy
+    return matrices
+
+
+def matrices_to_euler(matrices):
+    """Convert rotation matrices back into XYZ Euler angles in degrees.
+
+    Args:
+        matrices (numpy.ndarray): An (N, 3, 3) array of rotation matrices
+
+    Returns:
+        numpy.ndarray: An (N, 3) array of angles matching euler_to_matrices
+    """
+    matrices = numpy.asarray(matrices, dtype=numpy.float64)
+    sin_y = numpy.clip(-matrices[:, 0, 2], -1.0, 1.0)
+    cos_y = numpy.sqrt(1.0 - sin_y * sin_y)
+    gimbal = cos_y < 1e-9
+    x_rot = numpy.where(gimbal,
+                        numpy.arctan2(-matrices[:, 2, 1], matrices[:, 1, 1]),
+                        numpy.arctan2(matrices[:, 1, 2], matrices[:, 2, 2]))
+    z_rot = numpy.where(gimbal, 0.0,
+                        numpy.arctan2(matrices[:, 0, 1], matrices[:, 0, 0]))
+    return numpy.degrees(numpy.stack([x_rot, numpy.arcsin(sin_y), z_rot],
+                                     axis=1))
+
+
+def _normalize(vectors):
+    lengths = numpy.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / numpy.where(lengths > 0.0, lengths, 1.0)
+
+
+def normal_alignment_matrices(normals, aim=AIM_VECTOR, up=UP_VECTOR,
+                              world_up=WORLD_UP_VECTOR):
+    """Build rotations that point `aim` along each normal.
+
+    This is the orientation a normalConstraint with the same aim, up and
+    world up vectors would produce, computed for every normal at once.
+    Where a normal is parallel to the world up the world Z axis is used as
+    the up reference instead.
+
+    Args:
+        normals (numpy.ndarray): An (N, 3) array of surface normals
+        aim (tuple): The local axis that should follow the normal
+        up (tuple): The local axis that should face the world up
+        world_up (tuple): The world direction the up axis points toward
+
+    Returns:
+        numpy.ndarray: An (N, 3, 3) array of rotation matrices
+    """
+    aim_axis = _normalize(numpy.asarray(aim, dtype=numpy.float64))
+    up_axis = numpy.asarray(up, dtype=numpy.float64)
+    up_axis = _normalize(up_axis - up_axis.dot(aim_axis) * aim_axis)
+    local_frame = numpy.stack([aim_axis, up_axis,
+                               numpy.cross(aim_axis, up_axis)])
+    target_aim = _normalize(numpy.asarray(normals, dtype=numpy.float64))
+    world_up = numpy.broadcast_to(
+        numpy.asarray(world_up, dtype=numpy.float64), target_aim.shape)
+    target_up = world_up - (numpy.sum(world_up * target_aim, axis=1,
+                                      keepdims=True) * target_aim)
+    parallel = numpy.linalg.norm(target_up, axis=1) < 1e-9
+    if parallel.any():
+        fallback = numpy.array([0.0, 0.0, 1.0])
+        target_up[parallel] = fallback - (
+            target_aim[parallel].dot(fallback)[:, numpy.newaxis]
+            * target_aim[parallel])
+    target_up = _normalize(target_up)
+    target_frame = numpy.stack(
+        [target_aim, target_up, numpy.cross(target_aim, target_up)], axis=1)
+    return numpy.einsum("ji,njk->nik", local_frame, target_frame)
+
+
+class TransformBatch(object):
+    """Translation, rotation and scale arrays for a set of instances."""
+
+    def __init__(self, translations, rotations, scales):
+        self.translations = numpy.asarray(translations, dtype=numpy.float64)
+        self.rotations = numpy.asarray(rotations, dtype=numpy.float64)
+        self.scales = numpy.asarray(scales, dtype=numpy.float64)
+
+    def __len__(self):
+        return len(self.translations)
+
+    def __getitem__(self, key):
+        return TransformBatch(self.translations[key], self.rotations[key],
+                              self.scales[key])
+
+    def rotation_matrices(self):
+        """Return the (N, 3, 3) unscaled rotation matrices."""
+        return euler_to_matrices(self.rotations)
+
+    def matrices(self):
+        """Return the (N, 4, 4) local matrices as scale * rotate * translate.
+        """
+        matrices = numpy.zeros((len(self), 4, 4), dtype=numpy.float64)
+        matrices[:, :3, :3] = (self.rotation_matrices()
+                               * self.scales[:, :, numpy.newaxis])
+        matrices[:, 3, :3] = self.translations
+        matrices[:, 3, 3] = 1.0
+        return matrices
+
+
+def generate_transforms(positions, rotate_min, rotate_max, scale_min,
+                        scale_max, offset=0.0, normals=None, seed=None,
+                        start=0, ids=None):
+    """Build random transforms for every scatter position in one pass.
+
+    Args:
+        positions (numpy.ndarray): An (N, 3) array of world positions
+        rotate_min (tuple): Minimum X, Y and Z rotation in degrees
+        rotate_max (tuple): Maximum X, Y and Z rotation in degrees
+        scale_min (tuple): Minimum X, Y and Z scale
+        scale_max (tuple): Maximum X, Y and Z scale
+        offset (float): Distance to push each instance along its normal,
+            or along its own X axis when no normals are given
+        normals (numpy.ndarray): Optional (N, 3) surface normals. When
+            given, each instance's aim axis follows its normal and only
+            the random X rotation is kept, as a spin about that axis. The
+            Y and Z rotations would tip the aim off the normal.
+        seed (int): The scatter seed, a fresh one if None
+        start (int): Index of the first position within the whole scatter,
+            so a chunk draws the same numbers as the full scatter would
+        ids (numpy.ndarray): Explicit point ids to draw for instead of the
+            run starting at `start`, for scatters that dropped points
+
+    Returns:
+        TransformBatch: The transforms in the same order as `positions`
+    """
+    if seed is None:
+        seed = new_seed()
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    if ids is None:
+        draws = unit_draws(seed, start, start + len(positions), 6)
+    else:
+        draws = unit_draws_at(seed, ids, 6)
+    rotate_min = numpy.asarray(rotate_min, dtype=numpy.float64)
+    scale_min = numpy.asarray(scale_min, dtype=numpy.float64)
+    rotations = rotate_min + draws[:, :3] * (numpy.asarray(rotate_max)
+                                             - rotate_min)
+    scales = scale_min + draws[:, 3:] * (numpy.asarray(scale_max)
+                                         - scale_min)
+    batch = TransformBatch(positions.copy(), rotations, scales)
+    if normals is None:
+        if offset:
+            batch.translations += offset * batch.rotation_matrices()[:, 0]
+        return batch
+    alignment = normal_alignment_matrices(normals)
+    batch.rotations[:, 1:] = 0.0
+    batch.rotations = matrices_to_euler(
+        numpy.matmul(batch.rotation_matrices(), alignment))
+    if offset:
+        batch.translations += offset * alignment[:, 0]
+    return batch
+
+
+def _generate_piece(job):
+    positions, normals, start, ids, options = job
+    return generate_transforms(positions, normals=normals, start=start,
+                               ids=ids, **options)
+
+
+def generate_transforms_parallel(positions, rotate_min, rotate_max,
+                                 scale_min, scale_max, offset=0.0,
+                                 normals=None, seed=None, start=0,
+                                 ids=None, workers=None):
+    """Split generate_transforms across a pool of worker processes.
+
+    The work is cut on STREAM_CHUNK_SIZE boundaries and every point draws
+    from its own seeded stream, so the result is bit-identical to
+    generate_transforms for the same seed whatever the worker count.
+    Inside an interactive Maya session, point
+    multiprocessing.set_executable at mayapy before calling this.
+
+    Args:
+        workers (int): Number of processes, all cores if None
+
+    Returns:
+        TransformBatch: The transforms in the same order as `positions`
+    """
+    if seed is None:
+        seed = new_seed()
+    options = dict(rotate_min=rotate_min, rotate_max=rotate_max,
+                   scale_min=scale_min, scale_max=scale_max, offset=offset,
+                   seed=seed)
+    workers = workers or multiprocessing.cpu_count()
+    count = len(positions)
+    piece_size = -(-count // (workers * 4))
+    piece_size = max(STREAM_CHUNK_SIZE,
+                     -(-piece_size // STREAM_CHUNK_SIZE) * STREAM_CHUNK_SIZE)
+    if workers == 1 or count <= piece_size:
+        return generate_transforms(positions, normals=normals, start=start,
+                                   ids=ids, **options)
+    jobs = []
+    for low in range(0, count, piece_size):
+        high = min(low + piece_size, count)
+        jobs.append((positions[low:high],
+                     None if normals is None else normals[low:high],
+                     start + low, None if ids is None else ids[low:high],
+                     options))
+    pool = multiprocessing.Pool(workers)
+    try:
+        pieces = pool.map(_generate_piece, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return TransformBatch(
+        numpy.concatenate([piece.translations for piece in pieces]),
+        numpy.concatenate([piece.rotations for piece in pieces]),
+        numpy.concatenate([piece.scales for piece in pieces]))
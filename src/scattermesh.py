@@ -0,0 +1,302 @@
+import functools
+import logging
+import re
+
+import numpy
+
+log = logging.getLogger(__name__)
+
+LUMINANCE = (0.2126, 0.7152, 0.0722)
+
+VERTEX_RANGE_RE = re.compile(
+    r"^(?P<mesh>.+)\.vtx\[(?:(?P<all>\*)|(?P<start>\d+)(?::(?P<end>\d+))?)\]$")
+
+
+def parse_vertex_ranges(components, vertex_count=None):
+    """Turn compact vertex component strings into index arrays per mesh.
+
+    Ranges such as "pPlane1.vtx[0:999]" are expanded with numpy.arange, so
+    no per-vertex strings are ever built.
+
+    Args:
+        components (list): Vertex strings as returned by
+            polyListComponentConversion without flattening
+        vertex_count (callable): Returns the vertex count of a mesh, used
+            to expand "mesh.vtx[*]"
+
+    Returns:
+        dict: Mesh name to a sorted, unique int64 array of vertex ids
+    """
+    ranges = {}
+    for component in components:
+        match = VERTEX_RANGE_RE.match(component)
+        if not match:
+            raise ValueError("Not a vertex component: {}".format(component))
+        mesh = match.group("mesh")
+        if match.group("all"):
+            indices = numpy.arange(vertex_count(mesh), dtype=numpy.int64)
+        else:
+            start = int(match.group("start"))
+            end = int(match.group("end") or start)
+            indices = numpy.arange(start, end + 1, dtype=numpy.int64)
+        ranges.setdefault(mesh, []).append(indices)
+    return dict((mesh, numpy.unique(numpy.concatenate(arrays)))
+                for mesh, arrays in ranges.items())
+
+
+def format_vertex_ranges(mesh, indices):
+    """Build the shortest list of "mesh.vtx[a:b]" strings for `indices`."""
+    indices = numpy.unique(numpy.asarray(indices, dtype=numpy.int64))
+    if not len(indices):
+        return []
+    breaks = numpy.flatnonzero(numpy.diff(indices) != 1) + 1
+    starts = indices[numpy.concatenate([[0], breaks])]
+    ends = indices[numpy.concatenate([breaks - 1, [len(indices) - 1]])]
+    return ["{}.vtx[{}]".format(mesh, start) if start == end
+            else "{}.vtx[{}:{}]".format(mesh, start, end)
+            for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+class MeshBackend(object):
+    """Interface for anything that can bulk-read mesh vertex data.
+
+    A backend returns whole-mesh arrays indexed by vertex id and tells the
+    cache when a mesh changes. Tests can implement it without Maya.
+    """
+
+    def vertex_positions(self, mesh):
+        """Return a contiguous (N, 3) float64 array of world positions."""
+        raise NotImplementedError
+
+    def vertex_normals(self, mesh):
+        """Return a contiguous (N, 3) float64 array of world normals."""
+        raise NotImplementedError
+
+    def triangles(self, mesh):
+        """Return a (T, 3) int64 array of vertex ids, one row per triangle.
+        """
+        raise NotImplementedError
+
+    def vertex_colors(self, mesh, color_set):
+        """Return an (N, 4) float64 RGBA array from a color set.
+
+        Vertices without a color are returned as 0.
+        """
+        raise NotImplementedError
+
+    def vertex_weights(self, mesh, attribute):
+        """Return an (N,) float64 array from a per-vertex array attribute.
+        """
+        raise NotImplementedError
+
+    def vertex_uvs(self, mesh, uv_set=None):
+        """Return an (N, 2) float64 array with one UV per vertex."""
+        raise NotImplementedError
+
+    def sample_texture(self, texture, uvs):
+        """Return the (N,) luminance of a texture at an (N, 2) UV array."""
+        raise NotImplementedError
+
+    def add_change_callback(self, mesh, callback, removed=None):
+        """Call `callback` whenever the mesh changes. Return a handle.
+
+        `removed` is called when the mesh is about to be deleted.
+        """
+        raise NotImplementedError
+
+    def remove_change_callback(self, handle):
+        """Stop watching a mesh registered with add_change_callback."""
+        raise NotImplementedError
+
+
+class MayaMeshBackend(MeshBackend):
+    """Reads mesh data through the Maya Python API 2.0 in single calls."""
+
+    def _dag_path(self, mesh):
+        import maya.api.OpenMaya as om
+        selection = om.MSelectionList()
+        selection.add(mesh)
+        dag_path = selection.getDagPath(0)
+        dag_path.extendToShape()
+        return dag_path
+
+    def _mesh_fn(self, mesh):
+        import maya.api.OpenMaya as om
+        return om.MFnMesh(self._dag_path(mesh))
+
+    def vertex_positions(self, mesh):
+        import maya.api.OpenMaya as om
+        points = self._mesh_fn(mesh).getPoints(om.MSpace.kWorld)
+        points = numpy.array(points, dtype=numpy.float64)
+        return numpy.ascontiguousarray(points[:, :3])
+
+    def vertex_normals(self, mesh):
+        import maya.api.OpenMaya as om
+        normals = self._mesh_fn(mesh).getVertexNormals(False,
+                                                       om.MSpace.kWorld)
+        return numpy.ascontiguousarray(
+            numpy.array(normals, dtype=numpy.float64))
+
+    def triangles(self, mesh):
+        _, vertices = self._mesh_fn(mesh).getTriangles()
+        return numpy.array(vertices, dtype=numpy.int64).reshape(-1, 3)
+
+    def vertex_colors(self, mesh, color_set):
+        colors = self._mesh_fn(mesh).getVertexColors(color_set)
+        return numpy.clip(numpy.array(colors, dtype=numpy.float64), 0.0,
+                          None)
+
+    def vertex_weights(self, mesh, attribute):
+        import maya.cmds as cmds
+        attribute = self._dag_path(mesh).fullPathName() + "." + attribute
+        return numpy.array(cmds.getAttr(attribute) or [],
+                           dtype=numpy.float64)
+
+    def vertex_uvs(self, mesh, uv_set=None):
+        mesh_fn = self._mesh_fn(mesh)
+        us, vs = mesh_fn.getUVs(uv_set or "")
+        _, uv_ids = mesh_fn.getAssignedUVs(uv_set or "")
+        _, face_vertices = mesh_fn.getVertices()
+        uvs = numpy.zeros((mesh_fn.numVertices, 2), dtype=numpy.float64)
+        uv_ids = numpy.array(uv_ids, dtype=numpy.int64)
+        face_vertices = numpy.array(face_vertices, dtype=numpy.int64)
+        if len(uv_ids) == len(face_vertices):
+            uvs[face_vertices] = numpy.stack(
+                [numpy.array(us)[uv_ids], numpy.array(vs)[uv_ids]], axis=1)
+        return uvs
+
+    def sample_texture(self, texture, uvs):
+        import maya.cmds as cmds
+        uvs = numpy.asarray(uvs, dtype=numpy.float64)
+        colors = cmds.colorAtPoint(texture, output="RGB",
+                                   uCoord=uvs[:, 0].tolist(),
+                                   vCoord=uvs[:, 1].tolist())
+        return numpy.array(colors, dtype=numpy.float64).reshape(-1, 3).dot(
+            LUMINANCE)
+
+    def add_change_callback(self, mesh, callback, removed=None):
+        """Watch the shape and every transform above it for dirty plugs."""
+        import maya.api.OpenMaya as om
+        dag_path = self._dag_path(mesh)
+        callback_ids = []
+        if removed is not None:
+            callback_ids.append(om.MNodeMessage.addNodePreRemovalCallback(
+                dag_path.node(), lambda *args: removed()))
+        while dag_path.length() > 0:
+            callback_ids.append(om.MNodeMessage.addNodeDirtyCallback(
+                dag_path.node(), lambda *args: callback()))
+            dag_path.pop()
+        return callback_ids
+
+    def remove_change_callback(self, handle):
+        import maya.api.OpenMaya as om
+        for callback_id in handle:
+            om.MMessage.removeCallback(callback_id)
+
+
+class MeshData(object):
+    """Vertex arrays for one mesh, pulled from the backend on first use."""
+
+    def __init__(self, mesh, backend):
+        self.mesh = mesh
+        self.backend = backend
+        self._positions = None
+        self._normals = None
+        self._triangles = None
+        self._derived = {}
+
+    def reset(self):
+        """Forget the loaded arrays so the next access re-queries them."""
+        self._positions = None
+        self._normals = None
+        self._triangles = None
+        self._derived = {}
+
+    def derived(self, key, loader):
+        """Return an array computed from this mesh, caching it by `key`.
+
+        Args:
+            key (tuple): Identifies the array, such as a density source
+            loader (callable): Builds the array from this MeshData
+
+        Returns:
+            numpy.ndarray: The cached or newly loaded array
+        """
+        if key not in self._derived:
+            self._derived[key] = loader(self)
+        return self._derived[key]
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = self.backend.vertex_positions(self.mesh)
+        return self._positions
+
+    @property
+    def normals(self):
+        if self._normals is None:
+            self._normals = self.backend.vertex_normals(self.mesh)
+        return self._normals
+
+    @property
+    def triangles(self):
+        if self._triangles is None:
+            self._triangles = self.backend.triangles(self.mesh)
+        return self._triangles
+
+    @property
+    def vertex_count(self):
+        return len(self.positions)
+
+
+class MeshDataCache(object):
+    """Keeps one MeshData per mesh and resets it when the mesh changes.
+
+    Watches stay registered until the mesh is invalidated, so a change only
+    clears the arrays and repeated scatters on an unchanged target never
+    query the backend again. A deleted mesh is dropped on the next `get`,
+    and the owner calls `invalidate` when it is done with the cache so no
+    callbacks are left behind.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MayaMeshBackend()
+        self._entries = {}
+        self._watches = {}
+        self._removed = set()
+
+    def get(self, mesh):
+        """Return the cached MeshData for a mesh, creating it if needed."""
+        for name in list(self._removed):
+            self.invalidate(name)
+        entry = self._entries.get(mesh)
+        if entry is None:
+            entry = MeshData(mesh, self.backend)
+            self._entries[mesh] = entry
+            self._watches[mesh] = self.backend.add_change_callback(
+                mesh, entry.reset, functools.partial(self._on_removed, mesh))
+        return entry
+
+    def _on_removed(self, mesh):
+        # Callbacks are not removed from inside a callback, only marked.
+        entry = self._entries.get(mesh)
+        if entry is not None:
+            entry.reset()
+        self._removed.add(mesh)
+
+    def retain(self, meshes):
+        """Stop caching every mesh not in `meshes`."""
+        for name in set(self._entries) - set(meshes):
+            self.invalidate(name)
+
+    def invalidate(self, mesh=None):
+        """Stop caching a mesh, or every mesh if None."""
+        meshes = list(self._entries) if mesh is None else [mesh]
+        for name in meshes:
+            self._removed.discard(name)
+            if self._entries.pop(name, None) is None:
+                continue
+            log.debug("Invalidated mesh data for %s", name)
+            handle = self._watches.pop(name, None)
+            if handle is not None:
+                self.backend.remove_change_callback(handle)
@@ -0,0 +1,200 @@
+import contextlib
+import json
+import logging
+import platform
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+QUERY_COMMANDS = frozenset([
+    "about", "attributeQuery", "colorAtPoint", "exactWorldBoundingBox",
+    "filterExpand", "getAttr", "listConnections", "listRelatives", "ls",
+    "objExists", "pointPosition", "polyEvaluate",
+    "polyListComponentConversion", "refresh", "undoInfo"])
+
+
+def _timer():
+    return time.perf_counter()
+
+
+class CommandCounter(object):
+    """Stands in for maya.cmds and reports every call to a profiler."""
+
+    def __init__(self, commands, profiler):
+        self._commands = commands
+        self._profiler = profiler
+        self._wrapped = {}
+
+    def __getattr__(self, name):
+        wrapped = self._wrapped.get(name)
+        if wrapped is not None:
+            return wrapped
+        command = getattr(self._commands, name)
+        if not callable(command):
+            return command
+        profiler = self._profiler
+
+        def counted(*args, **kwargs):
+            start = _timer()
+            try:
+                return command(*args, **kwargs)
+            finally:
+                profiler.record_command(name, kwargs, _timer() - start)
+
+        self._wrapped[name] = counted
+        return counted
+
+
+class ScatterProfiler(object):
+    """Per-phase timing and Maya command counts for one scatter run.
+
+    Phases are timed with `phase`. Commands are counted while a run is
+    being stepped through `profile_run`, which swaps the `cmds` of the
+    calling module for a CommandCounter. Undo entries are estimated from
+    the names and query flags of the commands issued, or as one while an
+    undo chunk is open, rather than read from Maya's undo queue. Memory
+    tracing slows every Python call down several times, so it is off by
+    default and only runs inside each step.
+    """
+
+    def __init__(self, name="scatter", version=None, track_memory=False):
+        self.name = name
+        self.version = version
+        self.track_memory = track_memory
+        self.phases = {}
+        self.commands = {}
+        self.undo_entries = 0
+        self.undo_chunk_depth = 0
+        self.peak_memory = 0
+        self.seconds = 0.0
+        self.started = None
+        self._phase_stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a block of work, adding to any earlier time in `name`.
+
+        Commands issued inside a nested phase count against the inner one.
+        """
+        self._phase_stack.append(name)
+        start = _timer()
+        try:
+            yield
+        finally:
+            self._phase_stack.pop()
+            phase = self._phase_entry(name)
+            phase["seconds"] += _timer() - start
+            phase["runs"] += 1
+
+    @contextlib.contextmanager
+    def undo_chunk(self):
+        """Count everything issued inside the block as one undo entry."""
+        if not self.undo_chunk_depth:
+            self.undo_entries += 1
+        self.undo_chunk_depth += 1
+        try:
+            yield
+        finally:
+            self.undo_chunk_depth -= 1
+
+    def _phase_entry(self, name):
+        return self.phases.setdefault(
+            name, {"seconds": 0.0, "runs": 0, "commands": {}})
+
+    def record_command(self, name, flags, seconds):
+        """Add one Maya command call to the totals and the current phase."""
+        for totals in (self.commands,
+                       self._phase_entry(self._current_phase())["commands"]):
+            entry = totals.setdefault(name, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+        if self.undo_chunk_depth or name in QUERY_COMMANDS:
+            return
+        if not (flags.get("query") or flags.get("q")):
+            self.undo_entries += 1
+
+    def _current_phase(self):
+        return self._phase_stack[-1] if self._phase_stack else "other"
+
+    def profile_run(self, run, module):
+        """Step a scatter generator with its module's commands counted.
+
+        Only the time spent inside each step is measured, so time the UI
+        spends idle between steps is not included. Memory is traced only
+        inside each step too, and the peak is the largest of any step.
+
+        Args:
+            run (generator): The scatter generator to wrap
+            module (module): The module whose `cmds` is counted
+
+        Yields:
+            The values yielded by `run`
+        """
+        self.started = time.time()
+        commands = module.cmds
+        counter = CommandCounter(commands, self)
+        try:
+            while True:
+                tracing = self.track_memory and not tracemalloc.is_tracing()
+                if tracing:
+                    tracemalloc.start()
+                start = _timer()
+                module.cmds = counter
+                try:
+                    progress = next(run)
+                except StopIteration:
+                    return
+                finally:
+                    module.cmds = commands
+                    self.seconds += _timer() - start
+                    if tracing:
+                        self.peak_memory = max(
+                            self.peak_memory,
+                            tracemalloc.get_traced_memory()[1])
+                        tracemalloc.stop()
+                yield progress
+        finally:
+            run.close()
+            log.info("%s took %.2fs", self.name, self.seconds)
+
+    def report(self):
+        """Return the collected numbers as a JSON-ready dict."""
+        return {
+            "name": self.name,
+            "version": self.version,
+            "started": self.started,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seconds": self.seconds,
+            "peak_memory_bytes": self.peak_memory if self.track_memory
+            else None,
+            "undo_entries": self.undo_entries,
+            "undo_entries_estimated": True,
+            "commands": self.commands,
+            "phases": self.phases,
+        }
+
+    def format_report(self):
+        """Return a plain text summary of the report."""
+        lines = ["{} (version {}): {:.3f}s".format(self.name, self.version,
+                                                    self.seconds)]
+        if self.track_memory:
+            lines.append("Peak Python memory: {:.1f} MB".format(
+                self.peak_memory / 1048576.0))
+        lines.append("Undo entries (estimated from the commands): {}".format(
+            self.undo_entries))
+        for name, phase in sorted(self.phases.items(),
+                                  key=lambda item: -item[1]["seconds"]):
+            lines.append("")
+            lines.append("{}: {:.3f}s".format(name, phase["seconds"]))
+            for command, entry in sorted(phase["commands"].items(),
+                                         key=lambda item: -item[1]["seconds"]):
+                lines.append("    {}: {} calls, {:.3f}s".format(
+                    command, entry["calls"], entry["seconds"]))
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        """Write the report to a JSON file."""
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2, sort_keys=True)
@@ -0,0 +1,197 @@
+import math
+
+import numpy
+
+import scatterengine
+
+
+class SurfaceSamples(object):
+    """Points placed on a mesh surface and where they landed."""
+
+    def __init__(self, positions, normals, triangle_ids, barycentrics):
+        self.positions = positions
+        self.normals = normals
+        self.triangle_ids = triangle_ids
+        self.barycentrics = barycentrics
+
+    def __len__(self):
+        return len(self.positions)
+
+    def subset(self, indices):
+        """Return the samples at `indices` as a new SurfaceSamples."""
+        return SurfaceSamples(self.positions[indices], self.normals[indices],
+                              self.triangle_ids[indices],
+                              self.barycentrics[indices])
+
+
+class SurfaceSampler(object):
+    """Draws points anywhere on a triangle mesh, weighted by area.
+
+    The cumulative triangle area table is built once, so every sample is a
+    binary search into it plus a barycentric blend of the corners.
+    """
+
+    def __init__(self, positions, triangles, normals=None):
+        self.positions = numpy.asarray(positions, dtype=numpy.float64)
+        self.triangles = numpy.asarray(triangles, dtype=numpy.int64)
+        self.normals = normals
+        corners = self.positions[self.triangles]
+        face_normals = numpy.cross(corners[:, 1] - corners[:, 0],
+                                   corners[:, 2] - corners[:, 0])
+        areas = 0.5 * numpy.linalg.norm(face_normals, axis=1)
+        self.face_normals = face_normals / numpy.where(
+            areas > 0.0, 2.0 * areas, 1.0)[:, numpy.newaxis]
+        self.cumulative_area = numpy.cumsum(areas)
+
+    @property
+    def total_area(self):
+        if not len(self.cumulative_area):
+            return 0.0
+        return float(self.cumulative_area[-1])
+
+    def sample(self, count, seed=None):
+        """Draw `count` uniformly distributed surface points.
+
+        Sample i only depends on the seed and i, so asking for more points
+        with the same seed extends the previous result.
+
+        Returns:
+            SurfaceSamples: Positions, normals and triangle coordinates
+        """
+        if seed is None:
+            seed = scatterengine.new_seed()
+        draws = scatterengine.unit_draws(seed, 0, count, 3,
+                                         scatterengine.SELECTION_STREAM)
+        picks = numpy.searchsorted(self.cumulative_area,
+                                   draws[:, 0] * self.total_area,
+                                   side="right")
+        picks = numpy.minimum(picks, len(self.triangles) - 1)
+        root = numpy.sqrt(draws[:, 1])
+        blend = draws[:, 2]
+        barycentrics = numpy.stack([1.0 - root, root * (1.0 - blend),
+                                    root * blend], axis=1)
+        return SurfaceSamples(self.interpolate(self.positions, picks,
+                                               barycentrics),
+                              self._sample_normals(picks, barycentrics),
+                              picks, barycentrics)
+
+    def interpolate(self, values, triangle_ids, barycentrics):
+        """Blend per-vertex `values` at the given triangle coordinates."""
+        corners = numpy.asarray(values)[self.triangles[triangle_ids]]
+        if corners.ndim == 2:
+            return numpy.sum(corners * barycentrics, axis=1)
+        return numpy.sum(corners * barycentrics[:, :, numpy.newaxis], axis=1)
+
+    def _sample_normals(self, triangle_ids, barycentrics):
+        if self.normals is None:
+            return self.face_normals[triangle_ids]
+        normals = self.interpolate(self.normals, triangle_ids, barycentrics)
+        lengths = numpy.linalg.norm(normals, axis=1, keepdims=True)
+        return normals / numpy.where(lengths > 0.0, lengths, 1.0)
+
+
+class SpatialHash(object):
+    """A uniform grid that buckets point ids by the cell they fall in.
+
+    With a cell size at least as large as the biggest query distance, every
+    neighbour of a point is in its own cell or one of the 26 around it, so
+    each lookup is constant time however many points are stored.
+    """
+
+    _OFFSETS = [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1)
+                for z in (-1, 0, 1)]
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+
+    def key(self, point):
+        """Return the cell holding `point`."""
+        cell_size = self.cell_size
+        return (math.floor(point[0] / cell_size),
+                math.floor(point[1] / cell_size),
+                math.floor(point[2] / cell_size))
+
+    def insert(self, point_id, point):
+        self.cells.setdefault(self.key(point), []).append(point_id)
+
+    def neighbours(self, point):
+        """Yield the point ids in and around the cell of `point`."""
+        cells = self.cells
+        x_key, y_key, z_key = self.key(point)
+        for x_offset, y_offset, z_offset in self._OFFSETS:
+            bucket = cells.get((x_key + x_offset, y_key + y_offset,
+                                z_key + z_offset))
+            if bucket:
+                for point_id in bucket:
+                    yield point_id
+
+
+def poisson_filter(positions, min_distance):
+    """Keep points, in order, that are at least `min_distance` apart.
+
+    Each candidate is only compared with the accepted points in the
+    neighbouring grid cells, so the pass stays linear in the point count.
+
+    Args:
+        positions (numpy.ndarray): An (N, 3) array of candidate points
+        min_distance (float): The smallest allowed spacing
+
+    Returns:
+        numpy.ndarray: The indices of the accepted points
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    if min_distance <= 0.0:
+        return numpy.arange(len(positions))
+    grid = SpatialHash(min_distance)
+    points = positions.tolist()
+    limit = min_distance * min_distance
+    accepted = []
+    for index, point in enumerate(points):
+        x_pos, y_pos, z_pos = point
+        for other in grid.neighbours(point):
+            x_other, y_other, z_other = points[other]
+            if ((x_pos - x_other) ** 2 + (y_pos - y_other) ** 2
+                    + (z_pos - z_other) ** 2) < limit:
+                break
+        else:
+            grid.insert(index, point)
+            accepted.append(index)
+    return numpy.array(accepted, dtype=numpy.int64)
+
+
+def overlap_filter(positions, radii):
+    """Keep points, in order, whose bounding spheres do not intersect.
+
+    The grid cell is the largest diameter, so any sphere that could touch
+    a candidate is in one of the 27 cells around it and the pass stays
+    near-linear in the point count.
+
+    Args:
+        positions (numpy.ndarray): An (N, 3) array of candidate centres
+        radii (numpy.ndarray): The (N,) bounding radius of each candidate
+
+    Returns:
+        numpy.ndarray: The indices of the accepted points
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    radii = numpy.asarray(radii, dtype=numpy.float64)
+    if not len(positions) or radii.max() <= 0.0:
+        return numpy.arange(len(positions))
+    grid = SpatialHash(2.0 * radii.max())
+    points = positions.tolist()
+    sizes = radii.tolist()
+    accepted = []
+    for index, point in enumerate(points):
+        x_pos, y_pos, z_pos = point
+        radius = sizes[index]
+        for other in grid.neighbours(point):
+            x_other, y_other, z_other = points[other]
+            reach = radius + sizes[other]
+            if ((x_pos - x_other) ** 2 + (y_pos - y_other) ** 2
+                    + (z_pos - z_other) ** 2) < reach * reach:
+                break
+        else:
+            grid.insert(index, point)
+            accepted.append(index)
+    return numpy.array(accepted, dtype=numpy.int64)
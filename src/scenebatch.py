@@ -0,0 +1,343 @@
+"""Open, fix up and save-increment many scenes across worker processes.
+
+Run it with mayapy:
+
+    mayapy scenebatch.py "/proj/scenes/**/*.ma" --fixup rigfix:update_rig
+
+Every worker initializes Maya once and then takes scenes one at a time,
+so a slow or crashing scene only costs its own job.
+"""
+import argparse
+import glob
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import traceback
+
+
+import scenefile
+import scenemanifest
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.1
+STARTUP_TIMEOUT = 300.0
+
+
+def initialize_maya():
+    """Start Maya in a worker process."""
+    import maya.standalone
+    maya.standalone.initialize(name="python")
+
+
+def expand_scenes(patterns):
+    """Return the sorted, unique scene paths matching paths or globs."""
+    scenes = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        scenes.update(os.path.abspath(path) for path in matches
+                      if os.path.isfile(path))
+    return sorted(scenes)
+
+
+def resolve_callable(target):
+    """Return `target`, importing it first if it is "module:function"."""
+    if target is None or callable(target):
+        return target
+    module_name, _, name = target.partition(":")
+    function = importlib.import_module(module_name)
+    for part in name.split("."):
+        function = getattr(function, part)
+    return function
+
+
+def process_scene(path, fixup=None):
+    """Open a scene, run `fixup` on it and save it as the next version.
+
+    The job only finishes once the new version's manifest is written.
+
+    Returns:
+        str: The path of the new version
+    """
+    cmds = scenefile._cmds()
+    cmds.file(path, open=True, force=True)
+    if fixup is not None:
+        fixup(path)
+    saved = scenefile.SceneFile(path).save_increment()
+    scenemanifest.wait()
+    return saved
+
+
+def _worker_main(worker_id, initializer, initargs, fixup, tasks, results):
+    try:
+        if initializer is not None:
+            resolve_callable(initializer)(*initargs)
+        fixup = resolve_callable(fixup)
+    except Exception:
+        results.put(("init_failed", worker_id, traceback.format_exc()))
+        return
+    results.put(("ready", worker_id, None))
+    while True:
+        job = tasks.get()
+        if job is None:
+            return
+        index, path = job
+        results.put(("started", worker_id, index))
+        start = time.time()
+        try:
+            saved = process_scene(path, fixup)
+        except Exception:
+            results.put(("done", worker_id, (index, False, None,
+                                             traceback.format_exc(),
+                                             time.time() - start)))
+        else:
+            results.put(("done", worker_id, (index, True, saved, None,
+                                             time.time() - start)))
+
+
+class JobResult(object):
+    """What happened to one scene of a batch."""
+
+    def __init__(self, path, ok=False, saved=None, error=None, seconds=0.0):
+        self.path = path
+        self.ok = ok
+        self.saved = saved
+        self.error = error
+        self.seconds = seconds
+
+    def as_dict(self):
+        return {"path": self.path, "ok": self.ok, "saved": self.saved,
+                "error": self.error, "seconds": self.seconds}
+
+
+class BatchReport(object):
+    """The results of a batch run and how long it took."""
+
+    def __init__(self, results, seconds, workers):
+        self.results = results
+        self.seconds = seconds
+        self.workers = workers
+
+    @property
+    def failures(self):
+        return [result for result in self.results if not result.ok]
+
+    def summary(self):
+        """Return counts, timings and throughput as a dict."""
+        job_times = [result.seconds for result in self.results]
+        return {
+            "scenes": len(self.results),
+            "succeeded": len(self.results) - len(self.failures),
+            "failed": len(self.failures),
+            "workers": self.workers,
+            "seconds": self.seconds,
+            "scenes_per_minute": 60.0 * len(self.results) / self.seconds
+            if self.seconds else None,
+            "mean_job_seconds": sum(job_times) / len(job_times)
+            if job_times else None,
+            "max_job_seconds": max(job_times) if job_times else None,
+        }
+
+    def format(self):
+        """Return the summary and every failure as plain text."""
+        summary = self.summary()
+        lines = ["{scenes} scenes, {succeeded} saved, {failed} failed in "
+                 "{seconds:.1f}s with {workers} workers".format(**summary)]
+        if summary["scenes_per_minute"]:
+            lines.append("{:.1f} scenes per minute, slowest job {:.1f}s"
+                         .format(summary["scenes_per_minute"],
+                                 summary["max_job_seconds"]))
+        for failure in self.failures:
+            lines.append("")
+            lines.append("FAILED {}".format(failure.path))
+            lines.append(failure.error.rstrip())
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, "w") as report_file:
+            json.dump({"summary": self.summary(),
+                       "results": [result.as_dict()
+                                   for result in self.results]},
+                      report_file, indent=2)
+
+
+class _Worker(object):
+
+    def __init__(self, worker_id, context, results, initializer, initargs,
+                 fixup):
+        self.worker_id = worker_id
+        self.tasks = context.Queue()
+        self.job = None
+        self.started = None
+        self.spawned = time.time()
+        self.ready = False
+        self.init_error = None
+        self.process = context.Process(
+            target=_worker_main, name="SceneBatch-{}".format(worker_id),
+            args=(worker_id, initializer, initargs, fixup, self.tasks,
+                  results))
+        self.process.daemon = True
+        self.process.start()
+
+    def assign(self, index, path):
+        self.job = index
+        self.started = None
+        self.tasks.put((index, path))
+
+    def stop(self):
+        if self.process.is_alive():
+            self.tasks.put(None)
+            self.process.join(5.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+def run_batch(scenes, fixup=None, workers=None, timeout=None,
+              initializer=initialize_maya, initargs=(),
+              startup_timeout=STARTUP_TIMEOUT):
+    """Save-increment every scene, spread over worker processes.
+
+    A job that runs past `timeout` has its worker killed and replaced, and
+    a worker that dies takes only its current scene down with it. The
+    timeout runs from when the worker picks the job up, so starting Maya
+    in a new worker does not count against its first scene. Starting has
+    its own `startup_timeout` instead, and a worker that fails or hangs
+    while starting fails the scene it was given and is replaced.
+
+    Args:
+        scenes (list): Scene paths to process
+        fixup (callable or str): Called with each opened scene's path
+            before it is saved. Pass a module-level function or a
+            "module:function" string, as it is sent to other processes.
+        workers (int): Worker processes, the CPU count by default
+        timeout (float): Seconds a single scene may take
+        initializer (callable or str): Run once in each worker, starts
+            Maya by default
+        initargs (tuple): Arguments for the initializer
+        startup_timeout (float): Seconds a worker may take to start
+
+    Returns:
+        BatchReport: The result of every scene and the totals
+    """
+    start = time.time()
+    workers = max(1, min(workers or multiprocessing.cpu_count(),
+                         len(scenes) or 1))
+    context = multiprocessing.get_context("spawn")
+    results_queue = context.Queue()
+    results = [JobResult(path) for path in scenes]
+    pending = list(range(len(scenes)))
+    pending.reverse()
+    remaining = len(scenes)
+    pool = {}
+
+    def spawn(worker_id):
+        pool[worker_id] = _Worker(worker_id, context, results_queue,
+                                  initializer, initargs, fixup)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+    next_id = workers
+    try:
+        while remaining:
+            for worker in pool.values():
+                if worker.job is None and pending:
+                    index = pending.pop()
+                    worker.assign(index, scenes[index])
+            try:
+                message = results_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                kind, worker_id, payload = message
+                # A worker killed and replaced may still have reported.
+                worker = pool.get(worker_id)
+                if worker is None:
+                    kind = None
+                if kind == "init_failed":
+                    worker.init_error = payload
+                elif kind == "ready":
+                    worker.ready = True
+                elif kind == "started":
+                    if worker.job == payload:
+                        worker.started = time.time()
+                elif kind == "done":
+                    index, ok, saved, error, seconds = payload
+                    if worker.job == index:
+                        worker.job = None
+                        results[index] = JobResult(scenes[index], ok, saved,
+                                                   error, seconds)
+                        remaining -= 1
+                        log.info("%s %s (%s left)",
+                                 "Saved" if ok else "Failed", scenes[index],
+                                 remaining)
+            now = time.time()
+            for worker_id, worker in list(pool.items()):
+                if worker.job is None:
+                    continue
+                if worker.init_error is not None:
+                    error = "Worker failed to start:\n" + worker.init_error
+                elif startup_timeout is not None and not worker.ready and \
+                        now - worker.spawned > startup_timeout:
+                    error = "Worker did not start within {}s".format(
+                        startup_timeout)
+                elif timeout is not None and worker.started is not None and \
+                        now - worker.started > timeout:
+                    error = "Timed out after {}s".format(timeout)
+                elif not worker.process.is_alive():
+                    error = "Worker exited with code {}".format(
+                        worker.process.exitcode)
+                else:
+                    continue
+                results[worker.job] = JobResult(
+                    scenes[worker.job], error=error,
+                    seconds=now - (worker.started or now))
+                remaining -= 1
+                log.warning("%s: %s", scenes[worker.job], error)
+                worker.job = None
+                # One that failed to start exits by itself, killing it then
+                # can leave the results queue locked for every other worker.
+                if worker.init_error is None:
+                    worker.process.terminate()
+                worker.process.join()
+                del pool[worker_id]
+                spawn(next_id)
+                next_id += 1
+    finally:
+        for worker in pool.values():
+            worker.stop()
+    return BatchReport(results, time.time() - start, workers)
+
+
+def main(argv=None):
+    """Save-increment scenes in parallel from the command line."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("scenes", nargs="+",
+                        help="Scene paths or glob patterns")
+    parser.add_argument("--fixup",
+                        help="A module:function run on each opened scene")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--timeout", type=float,
+                        help="Seconds allowed per scene")
+    parser.add_argument("--startup-timeout", type=float,
+                        default=STARTUP_TIMEOUT,
+                        help="Seconds allowed for a worker to start Maya")
+    parser.add_argument("--report", help="Write the results to a JSON file")
+    args = parser.parse_args(argv)
+    scenes = expand_scenes(args.scenes)
+    report = run_batch(scenes, args.fixup, args.workers, args.timeout,
+                       startup_timeout=args.startup_timeout)
+    print(report.format())
+    if args.report:
+        report.write_json(args.report)
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import collections
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import fileutil
+import scenefile
+import scenenaming
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent);
+CREATE TABLE IF NOT EXISTS scenes (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    descriptor TEXT NOT NULL,
+    task TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scenes_name ON scenes (descriptor, task, version);
+CREATE INDEX IF NOT EXISTS scenes_mtime ON scenes (mtime);
+CREATE INDEX IF NOT EXISTS scenes_folder ON scenes (folder);
+"""
+
+SceneRecord = collections.namedtuple(
+    "SceneRecord",
+    ["path", "folder", "descriptor", "task", "version", "ext", "size",
+     "mtime"])
+
+_COLUMNS = ", ".join(SceneRecord._fields)
+
+
+def default_catalog_path(root):
+    """Return a per-user database path for the scenes under `root`."""
+    digest = hashlib.md5(os.path.normcase(os.path.abspath(root)).encode(
+        "utf-8")).hexdigest()
+    return os.path.join(os.path.expanduser("~"), ".smartsave",
+                        "catalog_{}.sqlite".format(digest[:16]))
+
+
+class RescanJob(object):
+    """A rescan queued on a catalog's background thread."""
+
+    def __init__(self, full=False):
+        self.full = full
+        self.listed = None
+        self.error = None
+        self.finished = threading.Event()
+
+
+def _list_folder(folder):
+    """Return the sub-folders and (name, size, mtime) files of a folder.
+
+    Hidden entries, such as a scene store, are skipped.
+    """
+    folders = []
+    files = []
+    for entry in os.scandir(folder):
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            folders.append(entry.path)
+        elif entry.is_file():
+            stat = entry.stat()
+            files.append((entry.name, stat.st_size, stat.st_mtime))
+    return folders, files
+
+
+class SceneCatalog(object):
+    """A SQLite index of every scene file under a scenes folder.
+
+    `rescan` only lists folders whose modification time changed since the
+    last scan and reuses the stored sub-folders of the others, so keeping
+    the catalog current costs about one stat per folder. A file rewritten
+    in place does not change its folder's time, so its size and time are
+    only refreshed by a full rescan.
+
+    A cold scan of a large project can take seconds, so a UI should call
+    `rescan_in_background` and query the catalog once the job finishes.
+    """
+
+    def __init__(self, root, database=None, template=None):
+        self.root = os.path.normpath(root)
+        self.template = template or scenenaming.default_template()
+        self.database = database or default_catalog_path(self.root)
+        if self.database != ":memory:":
+            folder = os.path.dirname(self.database)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        self.connection = sqlite3.connect(self.database)
+        if self.database != ":memory:":
+            # Lets the UI read while a background rescan writes.
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self._rescan_job = None
+        self._rescan_worker = fileutil.BackgroundWorker(
+            "SceneCatalog", self._run_rescan)
+
+    def close(self):
+        self.connection.close()
+
+    def rescan(self, full=False):
+        """Bring the catalog in line with the folders on disk.
+
+        Args:
+            full (bool): List every folder even if its time is unchanged
+
+        Returns:
+            int: How many folders were listed
+        """
+        start = time.time()
+        stored = dict(self.connection.execute(
+            "SELECT path, mtime FROM folders"))
+        listed = 0
+        seen = set()
+        pending = [(self.root, None)]
+        with self.connection:
+            while pending:
+                folder, parent = pending.pop()
+                seen.add(folder)
+                try:
+                    mtime = os.stat(folder).st_mtime
+                except OSError:
+                    continue
+                if not full and stored.get(folder) == mtime:
+                    pending.extend(
+                        (child, folder) for child, in self.connection.execute(
+                            "SELECT path FROM folders WHERE parent = ?",
+                            (folder,)))
+                    continue
+                scanned = time.time()
+                try:
+                    folders, files = _list_folder(folder)
+                except OSError as err:
+                    log.warning("Could not list %s: %s", folder, err)
+                    continue
+                listed += 1
+                self._store_folder(folder, parent, files)
+                # Leave a folder changed within the slack unconfirmed, so
+                # a file written in the same mtime tick is picked up next
+                # time.
+                trusted = scanned - mtime > scenefile.MTIME_SLACK
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+                    (folder, parent, mtime if trusted else None))
+                pending.extend((child, folder) for child in folders)
+            for folder in set(stored) - seen:
+                self.connection.execute(
+                    "DELETE FROM folders WHERE path = ?", (folder,))
+                self.connection.execute(
+                    "DELETE FROM scenes WHERE folder = ?", (folder,))
+        log.debug("Rescanned %s: listed %s of %s folders in %.3fs",
+                  self.root, listed, len(seen), time.time() - start)
+        return listed
+
+    def rescan_in_background(self, full=False):
+        """Rescan on a background thread with a connection of its own.
+
+        A rescan that is queued and not yet finished is reused rather than
+        queueing another.
+
+        Args:
+            full (bool): List every folder even if its time is unchanged
+
+        Returns:
+            RescanJob: Set finished once the catalog is up to date
+        """
+        if self.database == ":memory:":
+            raise ValueError("An in-memory catalog can only be rescanned "
+                             "in place")
+        job = self._rescan_job
+        if job is None or job.finished.is_set() or (full and not job.full):
+            job = self._rescan_job = RescanJob(full)
+            self._rescan_worker.put(job)
+        return job
+
+    def _run_rescan(self, job):
+        try:
+            catalog = SceneCatalog(self.root, self.database, self.template)
+            try:
+                job.listed = catalog.rescan(job.full)
+            finally:
+                catalog.close()
+        except Exception as err:
+            log.exception("Could not rescan %s", self.root)
+            job.error = err
+        job.finished.set()
+
+    def _store_folder(self, folder, parent, files):
+        self.connection.execute("DELETE FROM scenes WHERE folder = ?",
+                                (folder,))
+        stats = dict((name, (size, mtime)) for name, size, mtime in files)
+        rows = [(os.path.join(folder, scene.name), folder, scene.descriptor,
+                 scene.task, scene.ver, scene.ext) + stats[scene.name]
+                for scene in self.template.parse_many(stats)]
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows)
+
+    def _records(self, query, parameters=()):
+        return [SceneRecord(*row)
+                for row in self.connection.execute(query, parameters)]
+
+    def latest(self, descriptor, task, ext=None):
+        """Return the highest version of a descriptor and task, or None."""
+        query = ("SELECT {} FROM scenes WHERE descriptor = ? AND task = ?"
+                 .format(_COLUMNS))
+        parameters = [descriptor, task]
+        if ext:
+            query += " AND ext = ?"
+            parameters.append(ext)
+        records = self._records(query + " ORDER BY version DESC LIMIT 1",
+                                parameters)
+        return records[0] if records else None
+
+    def versions(self, descriptor=None, task=None, since=None):
+        """Return matching scenes, newest version first.
+
+        Args:
+            descriptor (str): Only this descriptor, any if None
+            task (str): Only this task, any if None
+            since (float): Only scenes modified after this time stamp
+        """
+        clauses = []
+        parameters = []
+        for column, value in (("descriptor", descriptor), ("task", task)):
+            if value:
+                clauses.append("{} = ?".format(column))
+                parameters.append(value)
+        if since is not None:
+            clauses.append("mtime >= ?")
+            parameters.append(since)
+        query = "SELECT {} FROM scenes".format(_COLUMNS)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        return self._records(
+            query + " ORDER BY descriptor, task, version DESC", parameters)
+
+    def descriptors(self, prefix=""):
+        """Return the known descriptors starting with `prefix`."""
+        return [row[0] for row in self.connection.execute(
+            "SELECT DISTINCT descriptor FROM scenes WHERE descriptor LIKE ? "
+            "ESCAPE '\\' ORDER BY descriptor", (_like_prefix(prefix),))]
+
+    def tasks(self, descriptor=None):
+        """Return the known tasks, of one descriptor if given."""
+        if descriptor:
+            rows = self.connection.execute(
+                "SELECT DISTINCT task FROM scenes WHERE descriptor = ? "
+                "ORDER BY task", (descriptor,))
+        else:
+            rows = self.connection.execute(
+                "SELECT DISTINCT task FROM scenes ORDER BY task")
+        return [row[0] for row in rows]
+
+
+def _like_prefix(prefix):
+    for character in ("\\", "%", "_"):
+        prefix = prefix.replace(character, "\\" + character)
+    return prefix + "%"
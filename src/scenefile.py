@@ -0,0 +1,530 @@
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import scenenaming
+
+log = logging.getLogger(__name__)
+
+SCENE_TYPES = {".ma": "mayaAscii", ".mb": "mayaBinary"}
+
+# Folder mtimes can be this coarse on network shares, so a scan this close
+# to the last change may have missed a file written in the same tick.
+MTIME_SLACK = 2.0
+
+# Checkpoints requested closer together than this are dropped.
+CHECKPOINT_INTERVAL = 2.0
+HASH_CHUNK_SIZE = 1 << 20
+# Header lines carry the file name and save date, so two saves of the same
+# scene can differ this much in size.
+HEADER_SLACK = 1024
+# Statements a Maya ASCII header is made of, continued lines are indented.
+HEADER_PREFIXES = (b"//", b"requires ", b"currentUnit ", b"fileInfo ",
+                   b"\t", b" ")
+# Versions tried past the highest one seen before reserving gives up.
+MAX_RESERVE_ATTEMPTS = 1000
+
+
+def _cmds():
+    import maya.cmds as cmds
+    return cmds
+
+
+def _is_volatile_header_line(line):
+    return line.startswith(b"//") or line.startswith(b'fileInfo "UUID"')
+
+
+def content_hash(path, chunk_size=HASH_CHUNK_SIZE):
+    """Return the sha256 of a scene file, read as a stream.
+
+    The comment lines and file UUID in a Maya ASCII header change on every
+    save, so they are left out wherever they appear among the requires,
+    currentUnit and fileInfo lines, and two saves of the same scene hash
+    the same.
+    """
+    content = hashlib.sha256()
+    with open(path, "rb") as scene_file:
+        if path.endswith(".ma"):
+            for line in iter(lambda: scene_file.readline(chunk_size), b""):
+                if not line.startswith(HEADER_PREFIXES):
+                    content.update(line)
+                    break
+                if not _is_volatile_header_line(line):
+                    content.update(line)
+        for data in iter(lambda: scene_file.read(chunk_size), b""):
+            content.update(data)
+    return content.hexdigest()
+
+
+def _create_placeholder(path):
+    """Create an empty file at `path` unless something is already there.
+
+    Returns:
+        bool: True if this call created the file
+    """
+    try:
+        handle = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError as err:
+        if err.errno == errno.EEXIST:
+            return False
+        raise
+    os.close(handle)
+    return True
+
+
+def _remove_if_empty(path):
+    """Remove a version placeholder that was never written over."""
+    try:
+        if not os.path.getsize(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def default_scene_folder():
+    """Return the scenes folder of the current Maya project."""
+    root = _cmds().workspace(query=True, rootDirectory=True)
+    return os.path.join(root, "scenes")
+
+
+class VersionIndex(object):
+    """The highest scene version per descriptor, task and extension.
+
+    A folder is read in one scandir pass and only read again once its
+    modification time changes, so repeated lookups in a large folder cost
+    a single stat call.
+    """
+
+    def __init__(self, folder, template=None):
+        self.folder = folder
+        self.template = template or scenenaming.default_template()
+        self.mtime = None
+        self.versions = {}
+        self.reserved = {}
+        self.hashes = {}
+        self._trusted = False
+
+    @staticmethod
+    def key(descriptor, task, ext):
+        return (os.path.normcase(descriptor), os.path.normcase(task),
+                os.path.normcase(ext))
+
+    def _names(self):
+        return [entry.name for entry in os.scandir(self.folder)
+                if entry.is_file()]
+
+    def refresh(self):
+        """Rescan the folder if it changed since the last scan."""
+        try:
+            mtime = os.stat(self.folder).st_mtime
+        except OSError:
+            self.mtime = None
+            self.versions = {}
+            return
+        if self._trusted and mtime == self.mtime:
+            return
+        scanned = time.time()
+        versions = {}
+        key = self.key
+        for scene in self.template.parse_many(self._names()):
+            scene_key = key(scene.descriptor, scene.task, scene.ext)
+            if scene.ver > versions.get(scene_key, 0):
+                versions[scene_key] = scene.ver
+        self.versions = versions
+        self.mtime = mtime
+        self._trusted = scanned - mtime > MTIME_SLACK
+        log.debug("Indexed %s scene names in %s", len(versions), self.folder)
+
+    def latest(self, descriptor, task, ext):
+        """Return the highest version saved, or 0 if there is none.
+
+        Versions added by this process count even before their file
+        shows up in the folder.
+        """
+        self.refresh()
+        key = self.key(descriptor, task, ext)
+        return max(self.versions.get(key, 0), self.reserved.get(key, 0))
+
+    def add(self, descriptor, task, ext, ver, content=None):
+        """Record a version written by this process and its content."""
+        key = self.key(descriptor, task, ext)
+        self.reserved[key] = max(self.reserved.get(key, 0), ver)
+        if content is not None:
+            self.hashes[key + (ver,)] = content
+
+    def content_hash(self, descriptor, task, ext, ver):
+        """Return the content hash of a version, or None if unknown.
+
+        Versions not written by this process are hashed from disk and
+        remembered.
+        """
+        key = self.key(descriptor, task, ext) + (ver,)
+        if key not in self.hashes:
+            path = os.path.join(self.folder, self.template.format(
+                descriptor, task, ver, ext))
+            if not os.path.isfile(path):
+                return None
+            self.hashes[key] = content_hash(path)
+        return self.hashes[key]
+
+
+_VERSION_INDEXES = {}
+
+
+def version_index(folder, template=None):
+    """Return the shared VersionIndex of a folder and naming template."""
+    template = template or scenenaming.default_template()
+    key = (os.path.normcase(os.path.abspath(folder)), template.template)
+    index = _VERSION_INDEXES.get(key)
+    if index is None:
+        index = _VERSION_INDEXES[key] = VersionIndex(folder, template)
+    return index
+
+
+def clear_version_indexes():
+    """Forget every cached folder index."""
+    _VERSION_INDEXES.clear()
+
+
+class SceneFile(object):
+    """An abstract representation of a Scene file.
+
+    Paths are plain strings handled with os.path, and Maya is only
+    imported when a scene has to be queried or saved, so this class can be
+    used outside of Maya. File names follow the studio's NamingTemplate.
+    With `use_store` set, versions are saved into the folder's
+    deduplicated SceneStore instead of as full copies. With
+    `write_manifests` set, each version saved to the folder gets a
+    scenemanifest written next to it in the background.
+    """
+
+    def __init__(self, path=None, template=None):
+        self.template = template or scenenaming.default_template()
+        self._folder_path = None
+        self.descriptor = 'main'
+        self.task = 'model'
+        self.ver = 1
+        self.ext = '.ma'
+        self.use_store = False
+        self.write_manifests = True
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self._last_checkpoint = None
+        self.skip_reason = None
+        self._placeholder = None
+        if not path:
+            path = _cmds().file(query=True, sceneName=True)
+        if path:
+            self._init_from_path(path)
+            return
+        self.folder_path = default_scene_folder()
+        log.info("Initialize with default properties.")
+
+    @property
+    def folder_path(self):
+        return self._folder_path
+
+    @folder_path.setter
+    def folder_path(self, val):
+        self._folder_path = os.path.normpath(val)
+
+    @property
+    def filename(self):
+        return self.template.format(self.descriptor, self.task, self.ver,
+                                    self.ext)
+
+    @property
+    def path(self):
+        return os.path.join(self.folder_path, self.filename)
+
+    def _version_index(self, folder=None):
+        return version_index(folder or self.folder_path, self.template)
+
+    @property
+    def store(self):
+        import scenestore
+        return scenestore.store_for_folder(self.folder_path)
+
+    def _init_from_path(self, path):
+        self.folder_path = os.path.dirname(path)
+        scene = self.template.parse(os.path.basename(path))
+        if scene is None:
+            raise ValueError("{} does not follow the naming template "
+                             "{}".format(path, self.template.template))
+        self.descriptor = scene.descriptor
+        self.task = scene.task
+        self.ver = scene.ver
+        self.ext = scene.ext
+
+    def save(self, transfers=None):
+        """Saves the scene file.
+
+        With a TransferQueue, the scene is written to local scratch and
+        copied to the folder in the background, and this returns as soon
+        as the local write is done. With `use_store`, it is written to
+        local scratch and added to the store. Either way the scene keeps
+        its name in the folder. A copy is hashed as it is made, so its
+        manifest does not read the scene back, and it never replaces a
+        file saved to the folder after the local one.
+
+        Args:
+            transfers (scenetransfer.TransferQueue): Copies the scene to
+                the folder after a local save
+
+        Returns:
+            str: The path to the scene file if successful
+        """
+        cmds = _cmds()
+        save_as = self._save_as
+        start = time.time()
+        if self.use_store:
+            import scenestore
+            scenestore.save_to_store(self.store, save_as, self.filename)
+            cmds.file(rename=self.path)
+            path = self.path
+        elif transfers is not None:
+            local_path = save_as(transfers.scratch_path(self.filename))
+            cmds.file(rename=self.path)
+            transfers.submit(local_path, self.path,
+                             self._manifest_callback(time.time() - start),
+                             self._failure_callback())
+            path = self.path
+        else:
+            if not os.path.isdir(self.folder_path):
+                log.warning("Missing directories in path. "
+                            "Creating directories...")
+                os.makedirs(self.folder_path)
+            path = save_as(self.path)
+            self._submit_manifest(path, time.time() - start)
+        self._version_index().add(self.descriptor, self.task, self.ext,
+                                  self.ver)
+        return path
+
+    def _manifest_fields(self, save_seconds):
+        return {"descriptor": self.descriptor, "task": self.task,
+                "version": self.ver, "ext": self.ext,
+                "save_seconds": save_seconds}
+
+    def _submit_manifest(self, path, save_seconds, sha256=None):
+        if self.write_manifests:
+            import scenemanifest
+            scenemanifest.submit(path, self._manifest_fields(save_seconds),
+                                 sha256)
+
+    def _manifest_callback(self, save_seconds):
+        """Return a Transfer callback that queues the copy's manifest."""
+        if not self.write_manifests:
+            return None
+        import scenemanifest
+        fields = self._manifest_fields(save_seconds)
+
+        def submit_manifest(transfer):
+            scenemanifest.submit(transfer.destination, fields,
+                                 transfer.sha256)
+
+        return submit_manifest
+
+    def _save_as(self, path):
+        cmds = _cmds()
+        cmds.file(rename=path)
+        return cmds.file(save=True,
+                         type=SCENE_TYPES.get(self.ext, "mayaAscii"))
+
+    def is_modified(self):
+        """Return True if the open scene has unsaved changes."""
+        return bool(_cmds().file(query=True, modified=True))
+
+    def next_avail_ver(self):
+        """Return the next available version number in the folder.
+
+        Versions are compared as numbers, so v1000 comes after v999, and
+        versions kept in the folder's store count as taken.
+        """
+        key = (self.descriptor, self.task, self.ext)
+        return max(self._version_index().latest(*key),
+                   self._version_index(self.store.manifest_folder).latest(
+                       *key)) + 1
+
+    def save_increment(self, transfers=None):
+        """Increments the version and saves the scene file.
+
+        If the existing version of a file already exists, it should increment
+        from the largest version number available in the folder.
+
+        Returns:
+            str: The path to the scene file if successful
+        """
+        self.reserve_version()
+        try:
+            path = self.save(transfers)
+        except Exception:
+            self._release_placeholder()
+            raise
+        self._placeholder = None
+        return path
+
+    def reserve_version(self):
+        """Claim the next free version, safely against other processes.
+
+        An empty placeholder is created at the version's path, or its store
+        manifest path with `use_store`, by an exclusive create that only
+        one writer can win. A writer that loses tries the next number, so
+        no lock is held and every writer ends up with its own version. The
+        save then writes over the placeholder.
+
+        Returns:
+            int: The reserved version
+        """
+        folder = self.folder_path
+        if self.use_store:
+            folder = self.store.manifest_folder
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        self.ver = self.next_avail_ver()
+        for _ in range(MAX_RESERVE_ATTEMPTS):
+            path = os.path.join(folder, self.filename)
+            if _create_placeholder(path):
+                self._placeholder = path
+                self._version_index().add(
+                    self.descriptor, self.task, self.ext, self.ver)
+                return self.ver
+            self.ver += 1
+        raise RuntimeError("Could not reserve a version of {} after {} "
+                           "tries".format(self.path, MAX_RESERVE_ATTEMPTS))
+
+    def _release_placeholder(self):
+        """Remove the placeholder if the save never wrote over it."""
+        path, self._placeholder = self._placeholder, None
+        if path:
+            _remove_if_empty(path)
+
+    def _failure_callback(self):
+        """Return a Transfer failure callback that removes the placeholder.
+
+        The copy only fails after the save has returned, so the callback
+        keeps the path the placeholder had when it was queued.
+        """
+        path = self._placeholder
+        if path is None:
+            return None
+
+        def release_placeholder(transfer):
+            _remove_if_empty(path)
+
+        return release_placeholder
+
+    def _is_saved_as(self, scene_name):
+        """Return True if `scene_name` is a version of this scene."""
+        scene = self.template.parse(os.path.basename(scene_name or ""))
+        if scene is None:
+            return False
+        return (os.path.normcase(os.path.normpath(
+                    os.path.dirname(scene_name))) ==
+                os.path.normcase(self.folder_path) and
+                VersionIndex.key(scene.descriptor, scene.task, scene.ext) ==
+                VersionIndex.key(self.descriptor, self.task, self.ext))
+
+    def _matches_version(self, ver, local_path, content):
+        if not ver:
+            return False
+        index = self._version_index()
+        key = index.key(self.descriptor, self.task, self.ext) + (ver,)
+        if key not in index.hashes:
+            # Only read a version back from the folder if it could match.
+            path = os.path.join(self.folder_path, self.template.format(
+                self.descriptor, self.task, ver, self.ext))
+            if not os.path.isfile(path) or abs(
+                    os.path.getsize(path) -
+                    os.path.getsize(local_path)) > HEADER_SLACK:
+                return False
+        return content == index.content_hash(self.descriptor, self.task,
+                                             self.ext, ver)
+
+    def checkpoint(self, transfers=None, force=False):
+        """Save the next version, but only if the scene changed.
+
+        Requests within `checkpoint_interval` seconds of the last one, or
+        while Maya reports no unsaved changes to a scene already saved under
+        this descriptor and task, are dropped. Otherwise the
+        scene is written to local scratch and only copied to the folder if
+        its content differs from the latest version. Why a request saved
+        nothing is kept in `skip_reason`, for the UI to show.
+
+        Args:
+            transfers (scenetransfer.TransferQueue): Copies the new
+                version to the folder in the background
+            force (bool): Skip the interval and unsaved changes checks
+
+        Returns:
+            str: The path of the new version, or None if nothing was saved
+        """
+        cmds = _cmds()
+        scene_name = cmds.file(query=True, sceneName=True)
+        now = time.time()
+        self.skip_reason = None
+        if not force:
+            if (self._last_checkpoint is not None and
+                    now - self._last_checkpoint < self.checkpoint_interval):
+                return self._skip_checkpoint(
+                    "the last save was {:.1f}s ago".format(
+                        now - self._last_checkpoint))
+            if self._is_saved_as(scene_name) and not self.is_modified():
+                return self._skip_checkpoint("there are no unsaved changes")
+        self._last_checkpoint = now
+        import scenetransfer
+        index = self._version_index()
+        latest = self.next_avail_ver() - 1
+        self.ver = latest + 1
+        saved = False
+        if transfers is not None:
+            local_path = transfers.scratch_path(self.filename)
+        else:
+            local_path = os.path.join(tempfile.mkdtemp(prefix="checkpoint_"),
+                                      self.filename)
+        scratch = os.path.dirname(local_path)
+        try:
+            start = time.time()
+            self._save_as(local_path)
+            save_seconds = time.time() - start
+            content = content_hash(local_path)
+            if self._matches_version(latest, local_path, content):
+                self.ver = latest
+                cmds.file(rename=scene_name or self.path)
+                return self._skip_checkpoint(
+                    "the scene matches version {}".format(latest))
+            self.reserve_version()
+            cmds.file(rename=self.path)
+            if self.use_store:
+                self.store.add(local_path, self.filename)
+            elif transfers is not None:
+                transfers.submit(local_path, self.path,
+                                 self._manifest_callback(save_seconds),
+                                 self._failure_callback())
+                scratch = None
+            else:
+                if not os.path.isdir(self.folder_path):
+                    os.makedirs(self.folder_path)
+                self._submit_manifest(
+                    self.path, save_seconds,
+                    scenetransfer.copy_file(local_path, self.path))
+            saved = True
+        finally:
+            if not saved:
+                self._release_placeholder()
+            self._placeholder = None
+            if scratch is not None:
+                shutil.rmtree(scratch, ignore_errors=True)
+        index.add(self.descriptor, self.task, self.ext, self.ver, content)
+        return self.path
+
+    def _skip_checkpoint(self, reason):
+        self.skip_reason = reason
+        log.info("Skipped saving, %s.", reason)
+        return None
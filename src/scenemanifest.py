@@ -0,0 +1,185 @@
+"""Post-save manifests written next to each saved scene.
+
+A manifest is a small JSON file, `<scene>.manifest.json`, holding the
+scene's path, version, size, sha256 and save timings. It is written by a
+background thread so saving returns as soon as the scene is on disk, and
+every registered hook is called with it so pipeline tools can register a
+version without reading the scene again:
+
+    import scenemanifest
+
+    def register(manifest):
+        asset_db.add(manifest["path"], manifest["sha256"])
+
+    scenemanifest.register_hook(register)
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import fileutil
+
+log = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+_HOOKS = []
+
+
+def manifest_path(path):
+    """Return where the manifest of the scene at `path` is written."""
+    return path + MANIFEST_SUFFIX
+
+
+def read_manifest(path):
+    """Return the manifest of the scene at `path`."""
+    with open(manifest_path(path)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def file_digest(path, chunk_size=HASH_CHUNK_SIZE):
+    """Return the sha256 and size of a file, read into one reused buffer.
+
+    Returns:
+        tuple: The hex digest and the size in bytes
+    """
+    file_hash = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, "rb") as scene_file:
+        while True:
+            count = scene_file.readinto(buffer)
+            if not count:
+                break
+            file_hash.update(view[:count])
+            size += count
+    return file_hash.hexdigest(), size
+
+
+def register_hook(hook):
+    """Call `hook` with every manifest written from now on.
+
+    Hooks run on the manifest thread, and one that raises is logged and
+    does not stop the others.
+    """
+    if hook not in _HOOKS:
+        _HOOKS.append(hook)
+
+
+def unregister_hook(hook):
+    if hook in _HOOKS:
+        _HOOKS.remove(hook)
+
+
+class ManifestJob(object):
+    """One scene waiting for its manifest."""
+
+    def __init__(self, path, fields=None, sha256=None):
+        self.path = path
+        self.fields = dict(fields or {})
+        self.sha256 = sha256
+        self.queued = time.time()
+        self.manifest = None
+        self.error = None
+        self.finished = threading.Event()
+
+
+class ManifestWriter(object):
+    """Writes scene manifests in order on one background thread.
+
+    The thread starts with the first job and stops once it has been idle
+    for a few seconds.
+    """
+
+    def __init__(self):
+        self._worker = fileutil.BackgroundWorker("SceneManifest",
+                                                 self._handle)
+
+    def submit(self, path, fields=None, sha256=None):
+        """Queue the manifest of a saved scene.
+
+        Args:
+            path (str): The saved scene
+            fields (dict): Extra values for the manifest
+            sha256 (str): The scene's hash if it is already known, such as
+                from a copy, so it does not have to be read again
+
+        Returns:
+            ManifestJob: Holds the manifest once it is written
+        """
+        job = ManifestJob(path, fields, sha256)
+        self._worker.put(job)
+        return job
+
+    def pending(self):
+        """Return the jobs that have not finished."""
+        return self._worker.pending()
+
+    def wait(self, timeout=None):
+        """Block until every queued manifest is written.
+
+        Returns:
+            bool: True if they all finished within `timeout` seconds
+        """
+        return self._worker.wait(timeout)
+
+    def _handle(self, job):
+        try:
+            self._write(job)
+        except Exception as err:
+            log.exception("Could not write the manifest of %s", job.path)
+            job.error = err
+        job.finished.set()
+
+    def _write(self, job):
+        start = time.time()
+        if job.sha256 is None:
+            sha256, size = file_digest(job.path)
+        else:
+            sha256, size = job.sha256, os.path.getsize(job.path)
+        manifest = {
+            "path": job.path,
+            "name": os.path.basename(job.path),
+            "size": size,
+            "sha256": sha256,
+            "saved": os.path.getmtime(job.path),
+            "queued_seconds": start - job.queued,
+            "hash_seconds": time.time() - start,
+        }
+        manifest.update(job.fields)
+        folder = os.path.dirname(job.path)
+        handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as manifest_file:
+                json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+            fileutil.replace(temp_path, manifest_path(job.path))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        job.manifest = manifest
+        log.debug("Wrote the manifest of %s", job.path)
+        for hook in list(_HOOKS):
+            try:
+                hook(manifest)
+            except Exception:
+                log.exception("Manifest hook %r failed", hook)
+
+
+_WRITER = ManifestWriter()
+
+
+def submit(path, fields=None, sha256=None):
+    """Queue a manifest on the shared writer, see ManifestWriter.submit."""
+    return _WRITER.submit(path, fields, sha256)
+
+
+def wait(timeout=None):
+    """Wait for the shared writer, see ManifestWriter.wait."""
+    return _WRITER.wait(timeout)
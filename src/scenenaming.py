@@ -0,0 +1,147 @@
+"""Scene file naming templates.
+
+A template is written like a format string, for example the default
+"{descriptor}_{task}_v{ver:03d}{ext}", and compiled once into a formatter
+and a regular expression that parses names back into their fields.
+
+A studio can change the template and the pattern each field matches with
+a JSON file, found through the SMARTSAVE_NAMING environment variable or at
+~/.smartsave/naming.json:
+
+    {"template": "{descriptor}.{task}.v{ver:04d}{ext}",
+     "fields": {"task": "[a-z]+"}}
+"""
+import collections
+import logging
+import os
+import re
+import string
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = "{descriptor}_{task}_v{ver:03d}{ext}"
+
+# The descriptor is matched lazily, so it can hold the separator as long
+# as the fields after it cannot.
+FIELD_PATTERNS = {
+    "descriptor": r"[^\\/\n]+?",
+    "task": r"[^\\/\n_.]+",
+    "ver": r"\d+",
+    "ext": r"\.[^\\/\n_.]+",
+}
+FIELDS = ("descriptor", "task", "ver", "ext")
+
+CONFIG_ENV = "SMARTSAVE_NAMING"
+CONFIG_PATH = os.path.join("~", ".smartsave", "naming.json")
+
+SceneName = collections.namedtuple("SceneName", ("name",) + FIELDS)
+
+
+class NamingTemplate(object):
+    """A scene name template compiled for formatting and parsing.
+
+    Args:
+        template (str): A format string using each of the descriptor, task,
+            ver and ext fields once
+        fields (dict): Regular expressions overriding FIELD_PATTERNS, use
+            (?:...) to group without capturing
+    """
+
+    def __init__(self, template=DEFAULT_TEMPLATE, fields=None):
+        self.template = template
+        self.fields = dict(FIELD_PATTERNS)
+        self.fields.update(fields or {})
+        # The text before each field and the field, in template order, for
+        # laying out a name. The last field is None after trailing text.
+        self.parts = []
+        body = []
+        seen = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            self.parts.append((literal, field))
+            body.append(re.escape(literal))
+            if field is None:
+                continue
+            if field not in self.fields:
+                raise ValueError("Unknown field {{{}}} in naming template "
+                                 "{}".format(field, template))
+            if field in seen:
+                raise ValueError("Field {{{}}} is used twice in naming "
+                                 "template {}".format(field, template))
+            if re.compile(self.fields[field]).groups:
+                raise ValueError("The pattern of field {{{}}} may not "
+                                 "capture groups".format(field))
+            seen.append(field)
+            body.append("(?P<{}>{})".format(field, self.fields[field]))
+        missing = [field for field in FIELDS if field not in seen]
+        if missing:
+            raise ValueError("Naming template {} is missing {}".format(
+                template, ", ".join(missing)))
+        # Where each field lands in a findall row, after the whole name.
+        self._columns = [seen.index(field) + 1 for field in FIELDS]
+        body = "".join(body)
+        self.regex = re.compile("^{}$".format(body))
+        self._many_regex = re.compile("^(?P<name>{})$".format(body),
+                                      re.MULTILINE)
+
+    def __repr__(self):
+        return "NamingTemplate({!r})".format(self.template)
+
+    def format(self, descriptor, task, ver, ext):
+        """Return the file name for a version."""
+        return self.template.format(descriptor=descriptor, task=task,
+                                    ver=ver, ext=ext)
+
+    def parse(self, name):
+        """Return the SceneName a file name stands for, or None."""
+        match = self.regex.match(name)
+        if match is None:
+            return None
+        return SceneName(name, match.group("descriptor"),
+                         match.group("task"), int(match.group("ver")),
+                         match.group("ext"))
+
+    def parse_many(self, names):
+        """Parse many file names with a single regular expression pass.
+
+        Returns:
+            list: A SceneName for each name that matches, in order
+        """
+        text = "\n".join(name for name in names if "\n" not in name)
+        descriptor, task, ver, ext = self._columns
+        return [SceneName(row[0], row[descriptor], row[task], int(row[ver]),
+                          row[ext])
+                for row in self._many_regex.findall(text)]
+
+
+def load_template(path):
+    """Read a NamingTemplate from a studio JSON config file."""
+    import json
+    with open(path) as config_file:
+        config = json.load(config_file)
+    return NamingTemplate(config.get("template", DEFAULT_TEMPLATE),
+                          config.get("fields"))
+
+
+_DEFAULT = []
+
+
+def default_template():
+    """Return the studio's template, or the built-in one.
+
+    The config is read once per session.
+    """
+    if not _DEFAULT:
+        path = os.environ.get(CONFIG_ENV) or os.path.expanduser(CONFIG_PATH)
+        if os.path.isfile(path):
+            log.debug("Loading naming template from %s", path)
+            _DEFAULT.append(load_template(path))
+        else:
+            _DEFAULT.append(NamingTemplate())
+    return _DEFAULT[0]
+
+
+def set_default_template(template):
+    """Use `template` for every scene from now on, None to reload it."""
+    del _DEFAULT[:]
+    if template is not None:
+        _DEFAULT.append(template)
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+import fileutil
+
+log = logging.getLogger(__name__)
+
+STORE_FOLDER = ".scenestore"
+MIN_CHUNK_SIZE = 1 << 14
+MAX_CHUNK_SIZE = 1 << 22
+BOUNDARY_MASK = (1 << 10) - 1
+COMPRESSION_LEVEL = 1
+
+
+def iter_chunks(path, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE,
+                boundary_mask=BOUNDARY_MASK):
+    """Split a file into content-defined chunks, reading it as a stream.
+
+    Chunks end after a line whose checksum has none of the `boundary_mask`
+    bits set, so a boundary depends only on that line and an edit only
+    changes the chunks around it. Chunks are kept between `min_size` and
+    `max_size` bytes, and a single line is never read past `max_size`.
+
+    Yields:
+        bytes: The chunks, in file order
+    """
+    crc32 = zlib.crc32
+    with open(path, "rb") as scene_file:
+        readline = scene_file.readline
+        lines = []
+        size = 0
+        while True:
+            line = readline(max_size)
+            if not line:
+                break
+            lines.append(line)
+            size += len(line)
+            if size >= max_size or (size >= min_size and
+                                    not crc32(line) & boundary_mask):
+                yield b"".join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield b"".join(lines)
+
+
+class SceneStore(object):
+    """Scene versions kept as shared chunks plus one manifest per version.
+
+    Each unique chunk is stored once, compressed, under its sha256. A
+    version is a JSON manifest listing its chunks, named after the scene
+    file it stands for, so saving a version that barely changed only
+    writes the few chunks that differ.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.object_folder = os.path.join(root, "objects")
+        self.manifest_folder = os.path.join(root, "manifests")
+
+    def object_path(self, digest):
+        return os.path.join(self.object_folder, digest[:2], digest[2:])
+
+    def manifest_path(self, name):
+        return os.path.join(self.manifest_folder, name)
+
+    def _write_atomic(self, path, data):
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as temp_file:
+                temp_file.write(data)
+            fileutil.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def add(self, path, name=None):
+        """Store a file as a new version.
+
+        Args:
+            path (str): The file to store
+            name (str): The version name, the file name by default
+
+        Returns:
+            dict: The manifest written for the version
+        """
+        name = name or os.path.basename(path)
+        start = time.time()
+        file_hash = hashlib.sha256()
+        chunks = []
+        written = 0
+        for chunk in iter_chunks(path):
+            file_hash.update(chunk)
+            digest = hashlib.sha256(chunk).hexdigest()
+            chunks.append([digest, len(chunk)])
+            object_path = self.object_path(digest)
+            if not os.path.exists(object_path):
+                data = zlib.compress(chunk, COMPRESSION_LEVEL)
+                self._write_atomic(object_path, data)
+                written += len(data)
+        manifest = {
+            "name": name,
+            "size": sum(size for _, size in chunks),
+            "sha256": file_hash.hexdigest(),
+            "created": time.time(),
+            "chunks": chunks,
+        }
+        self._write_atomic(self.manifest_path(name),
+                           json.dumps(manifest).encode("utf-8"))
+        log.info("Stored %s: %s chunks, %s new bytes in %.2fs", name,
+                 len(chunks), written, time.time() - start)
+        return manifest
+
+    def versions(self):
+        """Return the names of the stored versions.
+
+        Empty manifests are versions reserved by a save still in progress,
+        and are left out.
+        """
+        if not os.path.isdir(self.manifest_folder):
+            return []
+        return sorted(
+            name for name in os.listdir(self.manifest_folder)
+            if not name.endswith(".tmp") and
+            os.path.getsize(self.manifest_path(name)))
+
+    def manifest(self, name):
+        with open(self.manifest_path(name), "rb") as manifest_file:
+            return json.loads(manifest_file.read().decode("utf-8"))
+
+    def export(self, name, destination):
+        """Rebuild a stored version as a regular file.
+
+        The file is assembled a chunk at a time under a temporary name and
+        its sha256 checked before it is renamed into place.
+
+        Returns:
+            str: The destination path
+        """
+        manifest = self.manifest(name)
+        folder = os.path.dirname(os.path.abspath(destination))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        file_hash = hashlib.sha256()
+        try:
+            with os.fdopen(handle, "wb") as scene_file:
+                for digest, _ in manifest["chunks"]:
+                    with open(self.object_path(digest), "rb") as chunk_file:
+                        chunk = zlib.decompress(chunk_file.read())
+                    file_hash.update(chunk)
+                    scene_file.write(chunk)
+            if file_hash.hexdigest() != manifest["sha256"]:
+                raise ValueError("Stored version {} is corrupt".format(name))
+            fileutil.replace(temp_path, destination)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return destination
+
+    def restore(self, name, folder):
+        """Export a version under its own name into `folder`."""
+        return self.export(name, os.path.join(folder, name))
+
+    def stats(self):
+        """Return how many bytes the versions hold and take up on disk."""
+        logical = sum(self.manifest(name)["size"] for name in self.versions())
+        stored = 0
+        for folder, _, names in os.walk(self.object_folder):
+            stored += sum(os.path.getsize(os.path.join(folder, name))
+                          for name in names)
+        return {"versions": len(self.versions()), "logical_bytes": logical,
+                "stored_bytes": stored}
+
+
+def store_for_folder(folder):
+    """Return the SceneStore kept alongside a scene folder."""
+    return SceneStore(os.path.join(folder, STORE_FOLDER))
+
+
+def save_to_store(store, save, filename):
+    """Save a scene through `save` to local scratch and store it.
+
+    Args:
+        store (SceneStore): Where the version goes
+        save (callable): Writes the scene to the path it is given
+        filename (str): The version name
+
+    Returns:
+        dict: The manifest of the stored version
+    """
+    scratch = tempfile.mkdtemp(prefix="scenestore_")
+    try:
+        local_path = save(os.path.join(scratch, filename))
+        return store.add(local_path, filename)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
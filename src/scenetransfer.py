@@ -0,0 +1,281 @@
+import atexit
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+
+import fileutil
+
+log = logging.getLogger(__name__)
+
+PENDING = "pending"
+COPYING = "copying"
+DONE = "done"
+FAILED = "failed"
+
+TEMP_SUFFIX = ".transfer"
+EXIT_TIMEOUT = 60.0
+
+_QUEUES = weakref.WeakSet()
+
+
+class DestinationChangedError(RuntimeError):
+    """The destination was saved over after the copied file was written."""
+
+
+def _check_destination(source, destination):
+    """Raise DestinationChangedError if `destination` is newer than `source`.
+
+    An empty destination is a reserved version, and a copy keeps its
+    source's modification time, so only a file saved there some other way
+    after `source` was written counts as newer.
+    """
+    try:
+        stat = os.stat(destination)
+    except OSError:
+        return
+    if stat.st_size and stat.st_mtime > os.path.getmtime(source):
+        raise DestinationChangedError(
+            "{} was saved after {}".format(destination, source))
+
+
+def copy_file(source, destination, chunk_size=1 << 20, progress=None):
+    """Copy a file so the destination only ever appears complete.
+
+    The data is written next to the destination under a temporary name,
+    flushed to disk and then renamed over it. It is hashed on the way, so
+    the copy never has to be read back to checksum it. A destination saved
+    after the source, such as by a direct save while the copy was queued,
+    is never replaced.
+
+    Args:
+        source (str): The file to copy
+        destination (str): Where the copy ends up
+        chunk_size (int): Bytes read and written at a time
+        progress (callable): Called with the bytes copied so far
+
+    Returns:
+        str: The sha256 of the data copied
+
+    Raises:
+        DestinationChangedError: The destination is newer than the source
+    """
+    _check_destination(source, destination)
+    temp_path = destination + TEMP_SUFFIX
+    file_hash = hashlib.sha256()
+    copied = 0
+    try:
+        with open(source, "rb") as source_file, \
+                open(temp_path, "wb") as temp_file:
+            while True:
+                data = source_file.read(chunk_size)
+                if not data:
+                    break
+                temp_file.write(data)
+                file_hash.update(data)
+                copied += len(data)
+                if progress:
+                    progress(copied)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        shutil.copystat(source, temp_path)
+        _check_destination(source, destination)
+        fileutil.replace(temp_path, destination)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return file_hash.hexdigest()
+
+
+class Transfer(object):
+    """One file on its way from local scratch to its destination."""
+
+    def __init__(self, source, destination, callback=None,
+                 failure_callback=None):
+        self.source = source
+        self.destination = destination
+        self.callback = callback
+        self.failure_callback = failure_callback
+        self.size = os.path.getsize(source)
+        self.sha256 = None
+        self.copied = 0
+        self.status = PENDING
+        self.attempts = 0
+        self.error = None
+        self.finished = threading.Event()
+
+    @property
+    def progress(self):
+        """Return the fraction of the file copied, from 0 to 1."""
+        if not self.size:
+            return 1.0 if self.status == DONE else 0.0
+        return float(self.copied) / self.size
+
+    def describe(self):
+        """Return a one line status for the UI."""
+        name = os.path.basename(self.destination)
+        if self.status == COPYING:
+            return "{}: copying {:.0%}".format(name, self.progress)
+        if self.status == FAILED:
+            return "{}: failed ({}), kept at {}".format(name, self.error,
+                                                       self.source)
+        if self.status == PENDING and self.attempts:
+            return "{}: retrying ({})".format(name, self.error)
+        return "{}: {}".format(name, self.status)
+
+
+class TransferQueue(object):
+    """Copies locally saved files to their destinations in the background.
+
+    One worker thread copies the files in the order they were submitted,
+    so later versions never land before earlier ones. A failed copy is
+    retried with a growing delay, and the local file is only removed once
+    its copy is in place, if it was saved under `scratch_path`. A copy
+    whose destination was saved over in the meantime fails straight away
+    and keeps its local file.
+
+    The worker is a daemon thread, so copies still queued when Python
+    exits are waited for, for up to EXIT_TIMEOUT seconds, and any that
+    did not land are logged with where their local file was kept.
+    """
+
+    def __init__(self, scratch_folder=None, retries=3, retry_delay=1.0,
+                 chunk_size=1 << 20):
+        scratch_folder = scratch_folder or os.path.join(
+            tempfile.gettempdir(), "smartsave_scratch")
+        self.scratch_folder = os.path.normpath(scratch_folder)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.chunk_size = chunk_size
+        self.transfers = []
+        self._lock = threading.Lock()
+        self._worker = fileutil.BackgroundWorker("SceneTransfer",
+                                                 self._handle)
+        _QUEUES.add(self)
+
+    def scratch_path(self, filename):
+        """Return a fresh local path to save `filename` to."""
+        if not os.path.isdir(self.scratch_folder):
+            os.makedirs(self.scratch_folder)
+        return os.path.join(tempfile.mkdtemp(dir=self.scratch_folder),
+                            filename)
+
+    def submit(self, source, destination, callback=None,
+               failure_callback=None):
+        """Queue a copy of `source` to `destination`.
+
+        Args:
+            source (str): The local file
+            destination (str): Where it is copied to
+            callback (callable): Called from the worker with the Transfer
+                once its copy is in place
+            failure_callback (callable): Called from the worker with the
+                Transfer if it fails for good
+
+        Returns:
+            Transfer: Tracks the copy as it runs
+        """
+        transfer = Transfer(source, destination, callback, failure_callback)
+        with self._lock:
+            self.transfers.append(transfer)
+            self._worker.put(transfer)
+        return transfer
+
+    def pending(self):
+        """Return the transfers that have not finished."""
+        return self._worker.pending()
+
+    def clear_finished(self):
+        """Forget the transfers that completed successfully."""
+        with self._lock:
+            self.transfers = [transfer for transfer in self.transfers
+                              if transfer.status != DONE]
+
+    def wait(self, timeout=None):
+        """Block until every queued transfer has finished.
+
+        Returns:
+            bool: True if they all finished within `timeout` seconds
+        """
+        return self._worker.wait(timeout)
+
+    def _remove_scratch(self, path):
+        folder = os.path.dirname(path)
+        if os.path.dirname(folder) == self.scratch_folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _handle(self, transfer):
+        try:
+            self._transfer(transfer)
+        except Exception as err:
+            log.exception("Copy to %s failed", transfer.destination)
+            transfer.error = err
+            transfer.status = FAILED
+        if transfer.status == DONE:
+            callback = transfer.callback
+        else:
+            callback = transfer.failure_callback
+        if callback is not None:
+            try:
+                callback(transfer)
+            except Exception:
+                log.exception("Callback after copying %s failed",
+                              transfer.destination)
+        transfer.finished.set()
+
+    def _transfer(self, transfer):
+        def progress(copied):
+            transfer.copied = copied
+
+        while True:
+            transfer.status = COPYING
+            transfer.attempts += 1
+            try:
+                folder = os.path.dirname(transfer.destination)
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+                transfer.sha256 = copy_file(transfer.source,
+                                            transfer.destination,
+                                            self.chunk_size, progress)
+            except DestinationChangedError as err:
+                transfer.error = err
+                transfer.status = FAILED
+                log.error("Did not copy %s over a newer save: %s",
+                          transfer.source, err)
+                break
+            except (IOError, OSError) as err:
+                transfer.error = err
+                transfer.copied = 0
+                if transfer.attempts > self.retries:
+                    transfer.status = FAILED
+                    log.error("Could not copy %s to %s: %s",
+                              transfer.source, transfer.destination, err)
+                    break
+                transfer.status = PENDING
+                log.warning("Copy to %s failed, retrying: %s",
+                            transfer.destination, err)
+                time.sleep(self.retry_delay * 2 ** (transfer.attempts - 1))
+                continue
+            transfer.status = DONE
+            self._remove_scratch(transfer.source)
+            log.info("Copied %s", transfer.destination)
+            break
+
+
+def _finish_at_exit():
+    for transfers in list(_QUEUES):
+        if not transfers.wait(EXIT_TIMEOUT):
+            log.warning("Exiting with copies still queued")
+        for transfer in list(transfers.transfers):
+            if transfer.status != DONE:
+                log.warning("%s was not copied to %s, it is kept at %s",
+                            os.path.basename(transfer.source),
+                            transfer.destination, transfer.source)
+
+
+atexit.register(_finish_at_exit)
@@ -1,19 +1,23 @@
 import logging
+import os
 
 from PySide2 import QtWidgets, QtCore
-from shiboken2 import wrapInstance
-import maya.OpenMayaUI as omui
-import maya.cmds as cmds
-import pymel.core as pmc
-from pymel.core.system import Path
+
+import scenecatalog
+import scenetransfer
+from scenefile import SceneFile, default_scene_folder
 
 log = logging.getLogger(__name__)
 
+AUTOSAVE_INTERVAL = 5 * 60 * 1000
+
 
 def maya_main_window():
     """Return the maya main window widget"""
+    from shiboken2 import wrapInstance
+    import maya.OpenMayaUI as omui
     main_window = omui.MQtUtil.mainWindow()
-    return wrapInstance(long(main_window), QtWidgets.QWidget)
+    return wrapInstance(int(main_window), QtWidgets.QWidget)
 
 
 class SmartSaveUI(QtWidgets.QDialog):
@@ -23,12 +27,20 @@ class SmartSaveUI(QtWidgets.QDialog):
         super(SmartSaveUI, self).__init__(parent=maya_main_window())
         self.setWindowTitle("Smart Save")
         self.setMinimumWidth(500)
-        self.setMaximumHeight(200)
+        self.setMaximumHeight(400)
         self.setWindowFlags(self.windowFlags() ^
                             QtCore.Qt.WindowContextHelpButtonHint)
         self.scenefile = SceneFile()
+        self.transfers = scenetransfer.TransferQueue()
+        self.transfer_timer = QtCore.QTimer(self)
+        self.autosave_timer = QtCore.QTimer(self)
+        self.catalog_timer = QtCore.QTimer(self)
+        self.catalog = scenecatalog.SceneCatalog(default_scene_folder())
+        self.catalog_job = None
         self.create_ui()
         self.create_connections()
+        self._fill_completers()
+        self._refresh_catalog()
 
     def create_ui(self):
         self.title_lbl = QtWidgets.QLabel("Smart Save")
@@ -36,12 +48,14 @@ class SmartSaveUI(QtWidgets.QDialog):
         self.folder_lay = self._create_folder_ui()
         self.filename_lay = self._create_filename_ui()
         self.button_lay = self._create_button_ui()
+        self.transfer_lay = self._create_transfer_ui()
         self.main_lay = QtWidgets.QVBoxLayout()
         self.main_lay.addWidget(self.title_lbl)
         self.main_lay.addLayout(self.folder_lay)
         self.main_lay.addLayout(self.filename_lay)
         self.main_lay.addStretch()
         self.main_lay.addLayout(self.button_lay)
+        self.main_lay.addLayout(self.transfer_lay)
         self.setLayout(self.main_lay)
 
     def create_connections(self):
@@ -49,19 +63,136 @@ class SmartSaveUI(QtWidgets.QDialog):
         self.folder_browse_btn.clicked.connect(self._browse_folder)
         self.save_btn.clicked.connect(self._save)
         self.save_increment_btn.clicked.connect(self._save_increment)
+        self.restore_btn.clicked.connect(self._restore)
+        self.browse_btn.clicked.connect(self._browse_versions)
+        self.transfer_timer.timeout.connect(self._update_transfers)
+        self.autosave_timer.timeout.connect(self._autosave)
+        self.autosave_cbx.toggled.connect(self._toggle_autosave)
+        self.catalog_timer.timeout.connect(self._check_catalog)
 
     @QtCore.Slot()
     def _save_increment(self):
         """Save and increment of the scene"""
         self._set_scenefile_properties_from_ui()
-        self.scenefile.save_increment()
+        if self.changes_cbx.isChecked():
+            saved = self.scenefile.checkpoint(self._transfer_queue())
+        else:
+            saved = self.scenefile.save_increment(self._transfer_queue())
+        self._show_save_status(saved)
         self.ver_sbx.setValue(self.scenefile.ver)
+        self._update_transfers()
+
+    @QtCore.Slot()
+    def _autosave(self):
+        """Save a new version if the scene changed since the last one"""
+        self._set_scenefile_properties_from_ui()
+        saved = self.scenefile.checkpoint(self._transfer_queue())
+        if saved:
+            self._show_save_status(saved)
+            self.ver_sbx.setValue(self.scenefile.ver)
+            self._update_transfers()
+
+    @QtCore.Slot(bool)
+    def _toggle_autosave(self, checked):
+        """Start or stop the autosave timer"""
+        if checked:
+            self.autosave_timer.start(AUTOSAVE_INTERVAL)
+        else:
+            self.autosave_timer.stop()
 
     @QtCore.Slot()
     def _save(self):
         """Save the scene"""
         self._set_scenefile_properties_from_ui()
-        self.scenefile.save()
+        self._show_save_status(self.scenefile.save(self._transfer_queue()))
+        self._update_transfers()
+
+    def _show_save_status(self, saved):
+        if saved:
+            self.status_lbl.setText("Saved {}".format(
+                os.path.basename(saved)))
+        else:
+            self.status_lbl.setText("Not saved, {}".format(
+                self.scenefile.skip_reason))
+
+    def _refresh_catalog(self):
+        """Rescan the project's scenes in the background"""
+        self.catalog_job = self.catalog.rescan_in_background()
+        self.catalog_timer.start(250)
+
+    @QtCore.Slot()
+    def _check_catalog(self):
+        """Update the name completers once the rescan has finished"""
+        if self.catalog_job is None or not self.catalog_job.finished.is_set():
+            return
+        self.catalog_timer.stop()
+        self.catalog_job = None
+        self._fill_completers()
+
+    def _fill_completers(self):
+        self.descriptor_le.setCompleter(QtWidgets.QCompleter(
+            self.catalog.descriptors(), self))
+        self.task_le.setCompleter(QtWidgets.QCompleter(
+            self.catalog.tasks(), self))
+
+    @QtCore.Slot()
+    def _browse_versions(self):
+        """Pick any scene version in the project to continue from"""
+        # Lists the catalog as last scanned, the rescan shows up next time.
+        self._refresh_catalog()
+        records = self.catalog.versions(self.descriptor_le.text(),
+                                        self.task_le.text())
+        if not records:
+            records = self.catalog.versions()
+        if not records:
+            log.warning("No scenes found under %s%s", self.catalog.root,
+                        ", still scanning" if self.catalog_job else "")
+            return
+        labels = [os.path.relpath(record.path, self.catalog.root)
+                  for record in records]
+        label, accepted = QtWidgets.QInputDialog.getItem(
+            self, "Browse Versions", "Scene", labels, 0, False)
+        if not accepted:
+            return
+        record = records[labels.index(label)]
+        self.folder_le.setText(record.folder)
+        self.descriptor_le.setText(record.descriptor)
+        self.task_le.setText(record.task)
+        self.ver_sbx.setValue(record.version)
+        self.ext_lbl.setText(record.ext)
+
+    @QtCore.Slot()
+    def _restore(self):
+        """Restore a version kept in the folder's store"""
+        self._set_scenefile_properties_from_ui()
+        store = self.scenefile.store
+        versions = store.versions()
+        if not versions:
+            log.warning("No versions stored in %s", store.root)
+            return
+        name, accepted = QtWidgets.QInputDialog.getItem(
+            self, "Restore Version", "Version", versions,
+            len(versions) - 1, False)
+        if accepted:
+            path = store.restore(name, self.scenefile.folder_path)
+            log.info("Restored %s", path)
+
+    def _transfer_queue(self):
+        if self.background_cbx.isChecked():
+            return self.transfers
+        return None
+
+    @QtCore.Slot()
+    def _update_transfers(self):
+        """Show the state of every background copy"""
+        transfers = list(self.transfers.transfers)
+        self.transfer_list.clear()
+        self.transfer_list.addItems([transfer.describe()
+                                     for transfer in transfers])
+        if self.transfers.pending():
+            self.transfer_timer.start(250)
+        else:
+            self.transfer_timer.stop()
 
     def _set_scenefile_properties_from_ui(self):
         self.scenefile.folder_path = self.folder_le.text()
@@ -69,6 +200,7 @@ class SmartSaveUI(QtWidgets.QDialog):
         self.scenefile.task = self.task_le.text()
         self.scenefile.ver = self.ver_sbx.value()
         self.scenefile.ext = self.ext_lbl.text()
+        self.scenefile.use_store = self.store_cbx.isChecked()
 
     @QtCore.Slot()
     def _browse_folder(self):
@@ -82,13 +214,42 @@ class SmartSaveUI(QtWidgets.QDialog):
     def _create_button_ui(self):
         self.save_btn = QtWidgets.QPushButton("Save")
         self.save_increment_btn = QtWidgets.QPushButton("Save Increment")
-        layout = QtWidgets.QHBoxLayout()
-        layout.addWidget(self.save_btn)
-        layout.addWidget(self.save_increment_btn)
+        self.restore_btn = QtWidgets.QPushButton("Restore...")
+        self.browse_btn = QtWidgets.QPushButton("Browse...")
+        self.status_lbl = QtWidgets.QLabel("")
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.save_btn)
+        buttons.addWidget(self.save_increment_btn)
+        buttons.addWidget(self.restore_btn)
+        buttons.addWidget(self.browse_btn)
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(self.status_lbl)
+        return layout
+
+    def _create_transfer_ui(self):
+        self.background_cbx = QtWidgets.QCheckBox(
+            "Save locally and copy to the folder in the background")
+        self.store_cbx = QtWidgets.QCheckBox(
+            "Keep versions in the folder's deduplicated store")
+        self.changes_cbx = QtWidgets.QCheckBox(
+            "Only save increments that change the scene")
+        self.changes_cbx.setChecked(True)
+        self.autosave_cbx = QtWidgets.QCheckBox(
+            "Autosave changes every {} minutes".format(
+                AUTOSAVE_INTERVAL // 60000))
+        self.transfer_list = QtWidgets.QListWidget()
+        self.transfer_list.setMaximumHeight(80)
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.background_cbx)
+        layout.addWidget(self.store_cbx)
+        layout.addWidget(self.changes_cbx)
+        layout.addWidget(self.autosave_cbx)
+        layout.addWidget(self.transfer_list)
         return layout
 
     def _create_filename_ui(self):
-        layout = self._create_filename_headers()
+        headers = self._create_filename_headers()
         self.descriptor_le = QtWidgets.QLineEdit(self.scenefile.descriptor)
         self.descriptor_le.setMinimumWidth(100)
         self.task_le = QtWidgets.QLineEdit(self.scenefile.task)
@@ -96,14 +257,24 @@ class SmartSaveUI(QtWidgets.QDialog):
         self.ver_sbx = QtWidgets.QSpinBox()
         self.ver_sbx.setButtonSymbols(QtWidgets.QAbstractSpinBox.PlusMinus)
         self.ver_sbx.setFixedWidth(50)
+        self.ver_sbx.setMaximum(99999)
         self.ver_sbx.setValue(self.scenefile.ver)
         self.ext_lbl = QtWidgets.QLabel(".ma")
-        layout.addWidget(self.descriptor_le, 1, 0)
-        layout.addWidget(QtWidgets.QLabel("_"), 1, 1)
-        layout.addWidget(self.task_le, 1, 2)
-        layout.addWidget(QtWidgets.QLabel("_v"), 1, 3)
-        layout.addWidget(self.ver_sbx, 1, 4)
-        layout.addWidget(self.ext_lbl, 1, 5)
+        widgets = {"descriptor": self.descriptor_le, "task": self.task_le,
+                   "ver": self.ver_sbx, "ext": self.ext_lbl}
+        layout = QtWidgets.QGridLayout()
+        column = 0
+        # Follow the naming template, so the separators match the names.
+        for literal, field in self.scenefile.template.parts:
+            if literal:
+                layout.addWidget(QtWidgets.QLabel(literal), 1, column)
+                column += 1
+            if field is None:
+                continue
+            if field in headers:
+                layout.addWidget(headers[field], 0, column)
+            layout.addWidget(widgets[field], 1, column)
+            column += 1
         return layout
 
     def _create_filename_headers(self):
@@ -113,105 +284,15 @@ class SmartSaveUI(QtWidgets.QDialog):
         self.task_header_lbl.setStyleSheet("font: bold")
         self.ver_header_lbl = QtWidgets.QLabel("Version")
         self.ver_header_lbl.setStyleSheet("font: bold")
-        layout = QtWidgets.QGridLayout()
-        layout.addWidget(self.descriptor_header_lbl, 0, 0)
-        layout.addWidget(self.task_header_lbl, 0, 2)
-        layout.addWidget(self.ver_header_lbl, 0, 4)
-        return layout
+        return {"descriptor": self.descriptor_header_lbl,
+                "task": self.task_header_lbl,
+                "ver": self.ver_header_lbl}
 
     def _create_folder_ui(self):
-        default_folder = Path(cmds.workspace(rootDirectory=True, query=True))
-        default_folder = default_folder / "scenes"
-        self.folder_le = QtWidgets.QLineEdit(default_folder)
+        self.folder_le = QtWidgets.QLineEdit(default_scene_folder())
         self.folder_browse_btn = QtWidgets.QPushButton("...")
         layout = QtWidgets.QHBoxLayout()
         layout.addWidget(self.folder_le)
         layout.addWidget(self.folder_browse_btn)
         return layout
 
-
-class SceneFile(object):
-    """An abstract representation of a Scene file."""
-
-    def __init__(self, path=None):
-        self._folder_path = Path(cmds.workspace(query=True,
-                                                rootDirectory=True)) / "scenes"
-        self.descriptor = 'main'
-        self.task = 'model'
-        self.ver = 1
-        self.ext = '.ma'
-        scene = pmc.system.sceneName()
-        if not path and scene:
-            path = scene
-        if not path and not scene:
-            log.info("Initialize with default properties.")
-            return
-        self._init_from_path(path)
-
-    @property
-    def folder_path(self):
-        return self._folder_path
-
-    @folder_path.setter
-    def folder_path(self, val):
-        self._folder_path = Path(val)
-
-    @property
-    def filename(self):
-        pattern = "{descriptor}_{task}_v{ver:03d}{ext}"
-        return pattern.format(descriptor=self.descriptor,
-                              task=self.task,
-                              ver=self.ver,
-                              ext=self.ext)
-
-    @property
-    def path(self):
-        return self.folder_path / self.filename
-
-    def _init_from_path(self, path):
-        path = Path(path)
-        self.folder_path = path.parent
-        self.ext = path.ext
-        self.descriptor, self.task, ver = path.name.stripext().split("_")
-        self.ver = int(ver.split("v")[-1])
-
-    def save(self):
-        """Saves the scene file.
-
-        Returns:
-            Path: The path to the scene file if successful
-        """
-        try:
-            return pmc.system.saveAs(self.path)
-        except RuntimeError as err:
-            log.warning("Missing directories in path. Creating directories...")
-            self.folder_path.makedirs_p()
-            return pmc.system.saveAs(self.path)
-
-    def next_avail_ver(self):
-        """Return the next available version number in the folder."""
-        pattern = "{descriptor}_{task}_v*{ext}".format(
-            descriptor=self.descriptor, task=self.task, ext=self.ext)
-        matching_scenefiles = []
-        for file_ in self.folder_path.files():
-            if file_.name.fnmatch(pattern):
-                matching_scenefiles.append(file_)
-        if not matching_scenefiles:
-            return 1
-        matching_scenefiles.sort(reverse=True)
-        latest_scenefile = matching_scenefiles[0]
-        latest_scenefile = latest_scenefile.name.stripext()
-        latest_ver_num = int((latest_scenefile.split("_v"))[-1])
-        return latest_ver_num + 1
-
-    def save_increment(self):
-        """Increments the version and saves the scene file.
-
-        If the existing version of a file already exists, it should increment
-        from the largest version number available in the folder.
-
-        Returns:
-            Path: The path to the scene file if successful
-        """
-        self.ver = self.next_avail_ver()
-        self.save()